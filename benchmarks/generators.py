@@ -0,0 +1,116 @@
+import numpy as np
+
+from clemmys.alignment import EncodedAlignment, make_alphabet
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+SS_BLOCK_LENGTHS = {"H": 11., "E": 5., "T": 3., "C": 4.}
+SS_BLOCK_PROBABILITIES = {"H": 0.3, "E": 0.25, "T": 0.15, "C": 0.3}
+
+
+def make_column_profiles(length, seed=0, gap_fraction=0.1, concentration=0.5) -> np.ndarray:
+    """
+    Random amino acid + gap frequencies per column, Dirichlet distributed (a lower concentration gives more
+    conserved columns)
+
+    Returns
+    -------
+    (length x 21) matrix, amino acids in AMINO_ACIDS order then gaps, rows summing to 1
+    """
+    rng = np.random.default_rng(seed)
+    profiles = np.empty((length, len(AMINO_ACIDS) + 1))
+    profiles[:, :-1] = rng.dirichlet(np.full(len(AMINO_ACIDS), concentration), size=length) * (1 - gap_fraction)
+    profiles[:, -1] = gap_fraction
+    return profiles
+
+
+def make_alignment(num_sequences, length, seed=0, gap_fraction=0.1, concentration=0.5) -> EncodedAlignment:
+    """
+    Random EncodedAlignment with each column sampled independently from make_column_profiles,
+    built directly as a uint8 matrix (no sequence strings)
+
+    Parameters
+    ----------
+    num_sequences
+    length
+        alignment length
+    seed
+    gap_fraction
+        expected fraction of gaps per column
+    concentration
+        Dirichlet concentration of the column profiles
+
+    Returns
+    -------
+    EncodedAlignment with keys seq0, seq1, ...
+    """
+    rng = np.random.default_rng(seed)
+    alphabet = make_alphabet()
+    codes = np.array([alphabet.index(c) for c in AMINO_ACIDS + "X"], dtype=np.uint8)
+    profiles = make_column_profiles(length, seed, gap_fraction, concentration)
+    matrix = np.empty((num_sequences, length), dtype=np.uint8)
+    for j, profile in enumerate(profiles):
+        matrix[:, j] = codes[np.searchsorted(profile.cumsum(), rng.random(num_sequences), side="right")
+                             .clip(max=len(codes) - 1)]
+    return EncodedAlignment(matrix, [f"seq{i}" for i in range(num_sequences)], alphabet)
+
+
+def make_contacts(length, num_contacts=None, seed=0, min_separation=4, mean_separation=None):
+    """
+    Random residue pairs, with sequence separations drawn from an exponential distribution
+    (mostly local contacts with a long tail, as in predicted contact maps)
+
+    Parameters
+    ----------
+    length
+        alignment length
+    num_contacts
+        number of pairs (None => length)
+    seed
+    min_separation
+        smallest j - i
+    mean_separation
+        mean of j - i - min_separation (None => length / 10)
+
+    Returns
+    -------
+    i, j, scores (i < j, scores in [0, 1])
+    """
+    rng = np.random.default_rng(seed)
+    num_contacts = length if num_contacts is None else num_contacts
+    mean_separation = max(length / 10, 1.) if mean_separation is None else mean_separation
+    separations = min_separation + rng.exponential(mean_separation, num_contacts).astype(np.intp)
+    separations = np.minimum(separations, length - 1)
+    i = (rng.random(num_contacts) * (length - separations)).astype(np.intp)
+    return i, i + separations, rng.random(num_contacts)
+
+
+def make_contact_scores(length, num_contacts=None, seed=0, noise=0.1) -> np.ndarray:
+    """
+    Symmetric (length x length) float32 score matrix: make_contacts pairs on top of uniform noise
+    """
+    rng = np.random.default_rng(seed)
+    scores = (rng.random((length, length), dtype=np.float32) * noise)
+    scores = np.maximum(scores, scores.T)
+    i, j, values = make_contacts(length, num_contacts, seed)
+    scores[i, j] = scores[j, i] = noise + values
+    return scores
+
+
+def make_ss_labels(length, seed=0) -> str:
+    """
+    Random secondary structure string of H, E, T and C blocks with geometrically distributed lengths
+    (means in SS_BLOCK_LENGTHS), never repeating a block type
+    """
+    rng = np.random.default_rng(seed)
+    types = list(SS_BLOCK_PROBABILITIES)
+    probabilities = np.array([SS_BLOCK_PROBABILITIES[t] for t in types])
+    blocks, total, previous = [], 0, None
+    while total < length:
+        ss_type = types[rng.choice(len(types), p=probabilities)]
+        if ss_type == previous:
+            continue
+        block_length = int(rng.geometric(1 / SS_BLOCK_LENGTHS[ss_type]))
+        blocks.append(ss_type * block_length)
+        total += block_length
+        previous = ss_type
+    return "".join(blocks)[:length]
@@ -0,0 +1,314 @@
+"""
+Benchmarks of counting, glyph building, links and secondary structure rendering on synthetic data
+
+Each stage (construction, patch / collection generation, adding to Axes, Agg draw) is timed separately
+(best and mean of --repeats runs) and its peak memory measured with tracemalloc in one extra run
+(tracemalloc sees numpy and Python allocations, not Agg's C++ buffers).
+Results are written as JSON; pass a previous results file with --compare to print slowdowns.
+
+    python benchmarks/run_benchmarks.py -o results.json
+    python benchmarks/run_benchmarks.py --sequences 100 1000 --lengths 100 1000 --compare results.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from importlib import metadata
+
+import matplotlib
+import numpy as np
+from matplotlib import patches as m_patches
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from clemmys.links import layout_links, make_semicircle, make_semicircles, select_contacts
+from clemmys.logo import CoevolutionLogo, SequenceLogo
+from clemmys.secondary_structure import SecondaryStructure
+from generators import make_alignment, make_contact_scores, make_contacts, make_ss_labels
+
+BENCHMARKS = ("counting", "glyphs", "links", "ss")
+NUM_SEQUENCES = (100, 1000, 10_000, 100_000)
+LENGTHS = (100, 1000, 10_000)
+MAX_CELLS = 10 ** 8
+MAX_ARTISTS = 20_000
+NUM_PAIRS = 100
+RENDERING_SEQUENCES = 1000
+FIGURE_SIZE = (12., 3.)
+DPI = 100
+
+
+def measure(function, setup=None, repeats=3):
+    """
+    Times function(*setup()) repeats times (setup is not timed), then measures its peak memory once
+
+    Returns
+    -------
+    dict of best and mean seconds, repeats and peak tracemalloc bytes
+    """
+    times = []
+    for _ in range(repeats):
+        arguments = () if setup is None else setup()
+        start = time.perf_counter()
+        function(*arguments)
+        times.append(time.perf_counter() - start)
+    arguments = () if setup is None else setup()
+    tracemalloc.start()
+    try:
+        function(*arguments)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(seconds=min(times), mean_seconds=float(np.mean(times)), repeats=repeats, peak_bytes=peak)
+
+
+def make_axes():
+    figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+    FigureCanvasAgg(figure)
+    return figure.add_subplot()
+
+
+def make_drawn_axes(artists, xlim, ylim):
+    """
+    Setup for a draw stage: fresh Axes with artists (patches or collections) added
+    """
+    ax = make_axes()
+    for artist in artists:
+        if isinstance(artist, m_patches.Patch):
+            ax.add_patch(artist)
+        else:
+            ax.add_collection(artist)
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+    return ax,
+
+
+def draw(ax):
+    ax.figure.canvas.draw()
+
+
+def add_patches(ax, patches):
+    for patch in patches:
+        ax.add_patch(patch)
+
+
+def add_collections(ax, collections):
+    for collection in collections:
+        ax.add_collection(collection, autolim=False)
+
+
+def run_counting(num_sequences, lengths, repeats, max_cells):
+    for length in lengths:
+        for n in num_sequences:
+            if n * length > max_cells:
+                continue
+            alignment = make_alignment(n, length)
+            parameters = dict(num_sequences=n, length=length)
+            yield "counting", "construct", parameters, measure(lambda: SequenceLogo(alignment), repeats=repeats)
+            logo = SequenceLogo(alignment)
+            yield "counting", "get_counters", parameters, measure(logo.get_counters, repeats=repeats)
+            pairs = make_contacts(length, min(NUM_PAIRS, length), min_separation=1)[:2]
+            pairs = list(zip(pairs[0].tolist(), pairs[1].tolist()))
+            yield ("counting", "construct_coevolution", dict(parameters, num_pairs=len(pairs)),
+                   measure(lambda: CoevolutionLogo(alignment, pairs), repeats=repeats))
+
+
+def run_glyphs(lengths, repeats, max_artists):
+    for length in lengths:
+        logo = SequenceLogo(make_alignment(RENDERING_SEQUENCES, length))
+        table = logo.make_glyph_table()
+        num_glyphs = int(table.get_visible().sum())
+        parameters = dict(num_sequences=RENDERING_SEQUENCES, length=length, num_glyphs=num_glyphs)
+        xlim, ylim = (-0.5, length - 0.5), (0, 1)
+        yield "glyphs", "make_glyph_table", parameters, measure(logo.make_glyph_table, repeats=repeats)
+        yield "glyphs", "make_collection", parameters, measure(logo.make_collection, repeats=repeats)
+        yield ("glyphs", "add_collection", parameters,
+               measure(add_collections, lambda: (make_axes(), [logo.make_collection()]), repeats))
+        yield ("glyphs", "draw_collection", parameters,
+               measure(draw, lambda: make_drawn_axes([logo.make_collection()], xlim, ylim), repeats))
+        if num_glyphs > max_artists:
+            continue
+        glyphs = list(logo.iterate_glyphs())
+        yield ("glyphs", "glyph_make_patch", parameters,
+               measure(lambda: [glyph.make_patch() for glyph in glyphs], repeats=repeats))
+        yield "glyphs", "make_patches", parameters, measure(logo.make_patches, repeats=repeats)
+
+        def make_patches():
+            return [patch for patch in logo.make_patches() if patch is not None]
+
+        yield "glyphs", "add_patch", parameters, measure(add_patches, lambda: (make_axes(), make_patches()), repeats)
+        yield ("glyphs", "draw_patches", parameters,
+               measure(draw, lambda: make_drawn_axes(make_patches(), xlim, ylim), repeats))
+
+
+def run_links(lengths, repeats, max_cells, max_artists):
+    for length in lengths:
+        x1, x2, _ = make_contacts(length)
+        parameters = dict(length=length, num_links=len(x1))
+        y, valley, _ = layout_links(x1, x2, mode="alternate", spacing=0.)
+        height = float(np.abs(x2 - x1).max(initial=1.))
+        xlim, ylim = (-0.5, length - 0.5), (-height, height)
+        yield "links", "layout_links", parameters, measure(lambda: layout_links(x1, x2, mode="alternate"),
+                                                           repeats=repeats)
+
+        def make_collection():
+            return make_semicircles(x1, x2, y, valley, "black")[1]
+
+        yield "links", "make_semicircles", parameters, measure(make_collection, repeats=repeats)
+        yield ("links", "add_collection", parameters,
+               measure(add_collections, lambda: (make_axes(), [make_collection()]), repeats))
+        yield ("links", "draw_collection", parameters,
+               measure(draw, lambda: make_drawn_axes([make_collection()], xlim, ylim), repeats))
+        if length * length <= max_cells:
+            scores = make_contact_scores(length)
+            yield ("links", "select_contacts", dict(parameters, k=len(x1)),
+                   measure(lambda: select_contacts(scores, k=len(x1)), repeats=repeats))
+        if len(x1) > max_artists:
+            continue
+        links = list(zip(x1.tolist(), x2.tolist(), y.tolist(), valley.tolist()))
+
+        def make_patches():
+            patches = (make_semicircle(a, b, c, d, "black")[1] for a, b, c, d in links)
+            return [patch for patch in patches if patch is not None]
+
+        yield "links", "make_semicircle", parameters, measure(make_patches, repeats=repeats)
+        yield "links", "add_patch", parameters, measure(add_patches, lambda: (make_axes(), make_patches()), repeats)
+        yield ("links", "draw_patches", parameters,
+               measure(draw, lambda: make_drawn_axes(make_patches(), xlim, ylim), repeats))
+
+
+def run_ss(lengths, repeats, max_artists):
+    for length in lengths:
+        ss = SecondaryStructure(list(make_ss_labels(length)))
+        num_blocks = len(ss.ss_blocks)
+        parameters = dict(length=length, num_blocks=num_blocks)
+        xlim, ylim = (-0.5, length + 0.5), (-1, ss.width + 1)
+        yield "ss", "construct", parameters, measure(lambda: SecondaryStructure(ss.ss_labels), repeats=repeats)
+        yield "ss", "make_collections", parameters, measure(ss.make_collections, repeats=repeats)
+        yield ("ss", "add_collection", parameters,
+               measure(add_collections, lambda: (make_axes(), ss.make_collections()), repeats))
+        yield ("ss", "draw_collections", parameters,
+               measure(draw, lambda: make_drawn_axes(ss.make_collections(), xlim, ylim), repeats))
+        if num_blocks > max_artists:
+            continue
+        yield "ss", "make_patches", parameters, measure(ss.make_patches, repeats=repeats)
+        yield "ss", "add_patch", parameters, measure(add_patches, lambda: (make_axes(), ss.make_patches()), repeats)
+        yield ("ss", "draw_patches", parameters,
+               measure(draw, lambda: make_drawn_axes(ss.make_patches(), xlim, ylim), repeats))
+
+
+def get_versions() -> dict:
+    versions = dict(python=platform.python_version(), numpy=np.__version__, matplotlib=matplotlib.__version__)
+    try:
+        versions["clemmys"] = metadata.version("clemmys")
+    except metadata.PackageNotFoundError:
+        versions["clemmys"] = None
+    return versions
+
+
+def run_benchmarks(benchmarks=BENCHMARKS, num_sequences=NUM_SEQUENCES, lengths=LENGTHS, repeats=3,
+                   max_cells=MAX_CELLS, max_artists=MAX_ARTISTS, verbose=True) -> dict:
+    """
+    Runs the selected benchmarks
+
+    Parameters
+    ----------
+    benchmarks
+        any of BENCHMARKS
+    num_sequences
+        alignment sizes for counting
+    lengths
+        alignment lengths
+    repeats
+        timed runs per stage
+    max_cells
+        skips alignments (and contact score matrices) with more cells than this
+    max_artists
+        skips per-patch stages with more patches than this
+
+    Returns
+    -------
+    dict with platform, versions and a list of results (benchmark, stage, parameters, seconds,
+    mean_seconds, repeats, peak_bytes)
+    """
+    runs = dict(counting=lambda: run_counting(num_sequences, lengths, repeats, max_cells),
+                glyphs=lambda: run_glyphs(lengths, repeats, max_artists),
+                links=lambda: run_links(lengths, repeats, max_cells, max_artists),
+                ss=lambda: run_ss(lengths, repeats, max_artists))
+    results = []
+    for benchmark in benchmarks:
+        for name, stage, parameters, measurement in runs[benchmark]():
+            results.append(dict(benchmark=name, stage=stage, parameters=parameters, **measurement))
+            if verbose:
+                print(f"{name:>9} {stage:<22} {format_parameters(parameters):<50} "
+                      f"{measurement['seconds'] * 1e3:10.2f} ms {measurement['peak_bytes'] / 2 ** 20:9.1f} MiB",
+                      flush=True)
+    return dict(platform=platform.platform(), processor=platform.processor(), time=time.time(),
+                versions=get_versions(), results=results)
+
+
+def format_parameters(parameters: dict) -> str:
+    return " ".join(f"{name}={value}" for name, value in parameters.items())
+
+
+def get_result_key(result):
+    return result["benchmark"], result["stage"], format_parameters(result["parameters"])
+
+
+def compare_results(results: dict, baseline: dict, threshold=1.1) -> list:
+    """
+    Stages present in both runs, with their time ratio to the baseline
+
+    Returns
+    -------
+    list of (benchmark, stage, parameters, baseline seconds, seconds, ratio, regressed), in results order
+    """
+    baseline_seconds = {get_result_key(result): result["seconds"] for result in baseline["results"]}
+    comparison = []
+    for result in results["results"]:
+        key = get_result_key(result)
+        if key not in baseline_seconds:
+            continue
+        ratio = result["seconds"] / max(baseline_seconds[key], 1e-9)
+        comparison.append((*key, baseline_seconds[key], result["seconds"], ratio, ratio > threshold))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-b", "--benchmarks", nargs="+", default=list(BENCHMARKS), choices=BENCHMARKS)
+    parser.add_argument("-n", "--sequences", nargs="+", type=int, default=list(NUM_SEQUENCES),
+                        help="numbers of sequences (counting)")
+    parser.add_argument("-l", "--lengths", nargs="+", type=int, default=list(LENGTHS), help="alignment lengths")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--max-cells", type=float, default=MAX_CELLS,
+                        help="skip alignments and score matrices with more cells")
+    parser.add_argument("--max-artists", type=int, default=MAX_ARTISTS,
+                        help="skip per-patch stages with more patches")
+    parser.add_argument("-o", "--output", default=None, help="write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.1, help="time ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.benchmarks, args.sequences, args.lengths, args.repeats,
+                             args.max_cells, args.max_artists)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare is None:
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    comparison = compare_results(results, baseline, args.threshold)
+    print()
+    for benchmark, stage, parameters, before, after, ratio, regressed in comparison:
+        print(f"{benchmark:>9} {stage:<22} {parameters:<50} {before * 1e3:10.2f} -> {after * 1e3:10.2f} ms "
+              f"{ratio:6.2f}x{'  REGRESSION' if regressed else ''}")
+    regressions = sum(row[-1] for row in comparison)
+    print(f"{regressions} of {len(comparison)} stages slower than {args.threshold:.2f}x the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import json
+import struct
+
+import numpy as np
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+GAP_CHARACTERS = "-."
+UNKNOWN = 255
+CHUNK_ELEMENTS = 1 << 22
+PAIR_BLOCK_SIZE = 1024
+BINARY_MAGIC = b"CLEMMYS1"
+BINARY_HEADER_SIZE = 4096
+
+
+def make_alphabet(gap_character='X', alphabet=ALPHABET):
+    """
+    Alphabet used for encoding, with the gap character appended if it isn't already present
+    """
+    gap_character = gap_character.upper()
+    if gap_character not in alphabet:
+        alphabet += gap_character
+    return alphabet
+
+
+def make_lookup_table(alphabet, gap_character='X'):
+    """
+    Makes a 256-entry table mapping ASCII codes to indices in the alphabet
+    (lower-case letters map to their upper-case index, '-' and '.' map to the gap character)
+
+    Returns
+    -------
+    uint8 array, UNKNOWN for characters outside the alphabet
+    """
+    table = np.full(256, UNKNOWN, dtype=np.uint8)
+    for i, c in enumerate(alphabet):
+        table[ord(c)] = i
+        table[ord(c.lower())] = i
+    gap_index = alphabet.index(gap_character.upper())
+    for c in GAP_CHARACTERS:
+        if c not in alphabet:
+            table[ord(c)] = gap_index
+    return table
+
+
+def encode_sequences(sequences, table):
+    """
+    Encodes a list of equal-length sequences with a lookup table
+
+    Parameters
+    ----------
+    sequences
+        list of aligned sequences
+    table
+        from make_lookup_table
+
+    Returns
+    -------
+    uint8 (number of sequences x alignment length) matrix
+    """
+    if not len(sequences):
+        return np.zeros((0, 0), dtype=np.uint8)
+    length = len(sequences[0])
+    for sequence in sequences:
+        if len(sequence) != length:
+            raise ValueError(f"Aligned sequences must have the same length ({len(sequence)} != {length})")
+    raw = np.frombuffer("".join(sequences).encode("ascii"), dtype=np.uint8).reshape(len(sequences), length)
+    matrix = table[raw]
+    if (matrix == UNKNOWN).any():
+        unknown = sorted(set(chr(c) for c in np.unique(raw[matrix == UNKNOWN])))
+        raise ValueError(f"Characters not in alphabet: {unknown}")
+    return matrix
+
+
+def as_index(indices):
+    """
+    Converts a list of indices to a slice if they are contiguous and increasing (so numpy returns a view)
+    """
+    if isinstance(indices, slice):
+        return indices
+    indices = np.asarray(indices, dtype=np.intp)
+    if len(indices) and indices[0] >= 0 and np.array_equal(indices, np.arange(indices[0], indices[0] + len(indices))):
+        return slice(int(indices[0]), int(indices[0]) + len(indices))
+    return indices
+
+
+def get_chunk_size(num_columns, chunk_elements=CHUNK_ELEMENTS):
+    """
+    Number of rows to process at a time to keep intermediate arrays at about chunk_elements
+    """
+    return max(1, chunk_elements // max(1, num_columns))
+
+
+class EncodedAlignment:
+    """
+    Alignment encoded once as a uint8 (number of sequences x alignment length) matrix of indices into an alphabet
+    """
+
+    def __init__(self, matrix: np.ndarray, keys: list, alphabet: str = make_alphabet(), gap_character='X'):
+        """
+        Parameters
+        ----------
+        matrix
+            uint8 (number of sequences x alignment length) matrix of alphabet indices
+        keys
+            sequence keys, one per row (None => read from filename on first use, see load)
+        alphabet
+            string of characters, matrix values index into this
+        gap_character
+            character (in alphabet) representing gaps
+        """
+        self.matrix = matrix
+        self._keys = None if keys is None else list(keys)
+        self._key_index = None
+        self.alphabet = alphabet
+        self.gap_character = gap_character.upper()
+        self.filename = None
+        self.keys_range = None
+
+    @classmethod
+    def from_dict(cls, alignment: dict, keys=None, gap_character='X', alphabet=ALPHABET):
+        """
+        Parameters
+        ----------
+        alignment
+            dict of keys to aligned sequences
+        keys
+            give a list to restrict keys (None => all keys used)
+        gap_character
+            character to represent gaps ('-' and '.' are mapped to this)
+        alphabet
+            characters to encode (gap_character is added if missing)
+
+        Returns
+        -------
+        EncodedAlignment
+        """
+        if keys is None:
+            keys = list(alignment.keys())
+        alphabet = make_alphabet(gap_character, alphabet)
+        matrix = encode_sequences([alignment[key] for key in keys], make_lookup_table(alphabet, gap_character))
+        return cls(matrix, keys, alphabet, gap_character)
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        """
+        Opens an alignment saved with save, memory-mapped by default
+        (only the pages of the rows and columns used are read)
+
+        Parameters
+        ----------
+        filename
+        mmap
+            if False, reads the whole matrix into memory
+
+        Returns
+        -------
+        EncodedAlignment (keys are read on first use)
+        """
+        header = read_binary_header(filename)
+        shape = tuple(header["shape"])
+        if mmap:
+            matrix = np.memmap(filename, dtype=np.uint8, mode="r", offset=header["data_offset"], shape=shape)
+        else:
+            with open(filename, "rb") as f:
+                f.seek(header["data_offset"])
+                matrix = np.fromfile(f, dtype=np.uint8, count=shape[0] * shape[1]).reshape(shape)
+        alignment = cls(matrix, None, header["alphabet"], header["gap_character"])
+        alignment.filename = filename
+        alignment.keys_range = (header["keys_offset"], header["keys_length"])
+        return alignment
+
+    def save(self, filename):
+        """
+        Writes the alignment in the clemmys binary format (header, uint8 matrix, keys), to be opened with load
+        """
+        with open(filename, "wb") as f:
+            write_binary_header(f, self.matrix.shape, self.alphabet, self.gap_character)
+            chunk_size = get_chunk_size(self.alignment_length)
+            for start in range(0, self.num_sequences, chunk_size):
+                f.write(np.ascontiguousarray(self.matrix[start: start + chunk_size]).tobytes())
+            write_binary_keys(f, self.keys, self.matrix.shape, self.alphabet, self.gap_character)
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            keys_offset, keys_length = self.keys_range
+            with open(self.filename, "rb") as f:
+                f.seek(keys_offset)
+                data = f.read(keys_length).decode("utf-8")
+            self._keys = json.loads(data)
+        return self._keys
+
+    @property
+    def key_index(self):
+        if self._key_index is None:
+            self._key_index = {key: i for i, key in enumerate(self.keys)}
+        return self._key_index
+
+    @property
+    def num_sequences(self):
+        return self.matrix.shape[0]
+
+    @property
+    def alignment_length(self):
+        return self.matrix.shape[1]
+
+    @property
+    def gap_index(self):
+        return self.alphabet.index(self.gap_character)
+
+    def get_rows(self, keys=None):
+        """
+        Row indices of a list of keys (None => all rows)
+        """
+        if keys is None:
+            return None
+        return np.array([self.key_index[key] for key in keys], dtype=np.intp)
+
+    def select(self, keys=None, positions=None):
+        """
+        Restrict to a subset of keys (rows) and/or positions (columns)
+
+        Returns
+        -------
+        EncodedAlignment
+        """
+        matrix = self.matrix
+        if keys is not None:
+            matrix = matrix[as_index(self.get_rows(keys))]
+        else:
+            keys = self.keys
+        if positions is not None:
+            matrix = matrix[:, as_index(positions)]
+        return EncodedAlignment(matrix, keys, self.alphabet, self.gap_character)
+
+    def decode(self, row: int) -> str:
+        return np.frombuffer(self.alphabet.encode("ascii"), dtype=np.uint8)[self.matrix[row]].tobytes().decode("ascii")
+
+    def column_counts(self, rows=None, columns=None, weights=None) -> np.ndarray:
+        """
+        Counts occurrences of each alphabet character per column
+
+        Parameters
+        ----------
+        rows
+            row indices to count (None => all rows)
+        columns
+            column indices to count (None => all columns)
+        weights
+            one weight per counted row (None => unweighted)
+
+        Returns
+        -------
+        (number of columns x alphabet size) count matrix, int64 (float64 if weighted)
+        """
+        num_rows = self.num_sequences if rows is None else len(rows)
+        num_columns = self.alignment_length if columns is None else len(columns)
+        if columns is not None:
+            columns = as_index(columns)
+        alphabet_size = len(self.alphabet)
+        offsets = np.arange(num_columns, dtype=np.intp) * alphabet_size
+        counts = np.zeros(num_columns * alphabet_size, dtype=np.int64 if weights is None else np.float64)
+        chunk_size = get_chunk_size(num_columns)
+        for start in range(0, num_rows, chunk_size):
+            if rows is None:
+                block = self.matrix[start: start + chunk_size]
+            else:
+                block = self.matrix[rows[start: start + chunk_size]]
+            if columns is not None:
+                block = block[:, columns]
+            block_weights = None if weights is None else np.repeat(weights[start: start + chunk_size], num_columns)
+            counts += np.bincount((block + offsets).ravel(), weights=block_weights,
+                                  minlength=num_columns * alphabet_size)
+        return counts.reshape(num_columns, alphabet_size)
+
+    def pair_counts(self, pairs, rows=None, weights=None) -> np.ndarray:
+        """
+        Counts occurrences of each pair of alphabet characters for pairs of columns,
+        encoding a character pair (a, b) as the single integer a * alphabet size + b
+
+        Parameters
+        ----------
+        pairs
+            list of (column 1, column 2) tuples
+        rows
+            row indices to count (None => all rows)
+        weights
+            one weight per counted row (None => unweighted)
+
+        Returns
+        -------
+        (number of pairs x alphabet size ** 2) count matrix, int64 (float64 if weighted)
+        """
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        num_rows = self.num_sequences if rows is None else len(rows)
+        alphabet_size = len(self.alphabet)
+        num_pair_codes = alphabet_size ** 2
+        dtype = np.int64 if weights is None else np.float64
+        counts = np.zeros((len(pairs), num_pair_codes), dtype=dtype)
+        for pair_start in range(0, len(pairs), PAIR_BLOCK_SIZE):
+            pair_block = pairs[pair_start: pair_start + PAIR_BLOCK_SIZE]
+            # pair-major codes keep each pair's bincount writes within its own alphabet size ** 2 bins
+            offsets = (np.arange(len(pair_block), dtype=np.intp) * num_pair_codes)[:, None]
+            block_counts = np.zeros(len(pair_block) * num_pair_codes, dtype=dtype)
+            chunk_size = get_chunk_size(len(pair_block))
+            for start in range(0, num_rows, chunk_size):
+                if rows is None:
+                    block = self.matrix[start: start + chunk_size].T
+                else:
+                    block = self.matrix[rows[start: start + chunk_size]].T
+                codes = block[pair_block[:, 0]].astype(np.intp)
+                codes *= alphabet_size
+                codes += block[pair_block[:, 1]]
+                codes += offsets
+                block_weights = None if weights is None else np.tile(weights[start: start + chunk_size], len(pair_block))
+                block_counts += np.bincount(codes.ravel(), weights=block_weights,
+                                            minlength=len(pair_block) * num_pair_codes)
+            counts[pair_start: pair_start + len(pair_block)] = block_counts.reshape(len(pair_block), num_pair_codes)
+        return counts
+
+
+def write_binary_header(f, shape, alphabet, gap_character, keys_offset=0, keys_length=0):
+    """
+    Writes the fixed-size header of the clemmys binary alignment format at the start of a file
+    (magic, header length, JSON header, padded to BINARY_HEADER_SIZE where the matrix starts)
+    """
+    header = json.dumps(dict(alphabet=alphabet, gap_character=gap_character, shape=list(shape),
+                             data_offset=BINARY_HEADER_SIZE, keys_offset=keys_offset,
+                             keys_length=keys_length)).encode("utf-8")
+    if len(header) + 16 > BINARY_HEADER_SIZE:
+        raise ValueError("Binary alignment header too long")
+    f.seek(0)
+    f.write(BINARY_MAGIC + struct.pack("<Q", len(header)) + header)
+    f.write(b"\0" * (BINARY_HEADER_SIZE - len(header) - 16))
+
+
+def write_binary_keys(f, keys, shape, alphabet, gap_character):
+    """
+    Appends the keys as a JSON list after the matrix and updates the header with their location
+    (keys must be strings or integers, so that they are read back unchanged)
+    """
+    keys = list(keys)
+    for key in keys:
+        if not isinstance(key, (str, int)) or isinstance(key, bool):
+            raise ValueError(f"Keys must be strings or integers to be saved ({key!r})")
+    keys_offset = BINARY_HEADER_SIZE + shape[0] * shape[1]
+    f.seek(keys_offset)
+    data = json.dumps(keys).encode("utf-8")
+    f.write(data)
+    write_binary_header(f, shape, alphabet, gap_character, keys_offset, len(data))
+
+
+def read_binary_header(filename) -> dict:
+    with open(filename, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{filename} is not a clemmys binary alignment")
+        header_length, = struct.unpack("<Q", f.read(8))
+        return json.loads(f.read(header_length).decode("utf-8"))
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from clemmys.alignment import EncodedAlignment, get_chunk_size
+
+MAX_CACHE_BYTES = 1 << 30
+CACHE_VERSION = 1
+STALE_TEMPORARY_SECONDS = 3600
+EVICTION_TARGET = 0.9
+
+
+def hash_alignment(alignment: EncodedAlignment) -> str:
+    """
+    sha256 of an alignment's matrix, keys, alphabet and gap character.
+    Alignments memory-mapped from a binary file are identified by the file's path, size and modification time
+    instead, so they are not read
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([alignment.alphabet, alignment.gap_character, alignment.matrix.shape]).encode("utf-8"))
+    if alignment.filename is not None:
+        stat = os.stat(alignment.filename)
+        digest.update(json.dumps([str(Path(alignment.filename).resolve()), stat.st_size,
+                                  stat.st_mtime_ns]).encode("utf-8"))
+        return digest.hexdigest()
+    chunk_size = get_chunk_size(alignment.alignment_length)
+    for start in range(0, alignment.num_sequences, chunk_size):
+        digest.update(np.ascontiguousarray(alignment.matrix[start: start + chunk_size]).data)
+    digest.update("\n".join(alignment.keys).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def hash_parameter(value):
+    """
+    JSON-serializable stand-in for a counting parameter (arrays and long lists are hashed)
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): hash_parameter(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return [str(array.dtype), list(array.shape), hashlib.sha256(array.data).hexdigest()]
+    values = list(value)
+    if len(values) > 64:
+        return hashlib.sha256(json.dumps([hash_parameter(v) for v in values]).encode("utf-8")).hexdigest()
+    return [hash_parameter(v) for v in values]
+
+
+def get_cache_key(alignment: EncodedAlignment, **parameters) -> str:
+    """
+    Content-addressed key of whatever is computed from alignment with parameters
+    """
+    digest = hashlib.sha256()
+    digest.update(hash_alignment(alignment).encode("ascii"))
+    digest.update(json.dumps([CACHE_VERSION, hash_parameter(parameters)], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ProfileCache:
+    """
+    Directory of compressed .npz files keyed by content hashes,
+    evicting the least recently used files beyond a total size.
+    Files are written to a temporary name and renamed into place, so several processes can share a directory.
+    The directory is only scanned when this process's running estimate of its size goes over max_bytes
+    (the scan then corrects the estimate, including files written by other processes)
+    """
+
+    def __init__(self, directory, max_bytes=MAX_CACHE_BYTES):
+        """
+        Parameters
+        ----------
+        directory
+            cache directory (created if needed)
+        max_bytes
+            total size of cached files to keep
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.total_bytes = None
+
+    def get_filename(self, key) -> Path:
+        return self.directory / f"{key}.npz"
+
+    def load(self, key):
+        """
+        Cached arrays for key (None if not cached), marking the entry as recently used
+        """
+        filename = self.get_filename(key)
+        try:
+            with np.load(filename) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(filename)
+        except (FileNotFoundError, zipfile.BadZipFile, ValueError, OSError):
+            return None
+        return arrays
+
+    def save(self, key, **arrays):
+        """
+        Stores arrays under key (atomically) and evicts least recently used entries if the cache is too large
+        """
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            size = os.path.getsize(temporary)
+            os.replace(temporary, self.get_filename(key))
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        if self.total_bytes is None:
+            self.evict()
+        else:
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+        Removes temporary files left by interrupted writes (older than STALE_TEMPORARY_SECONDS),
+        then least recently used entries if the cache (including recent temporary files) is over max_bytes,
+        down to EVICTION_TARGET * max_bytes so that the next few saves don't need another scan
+        """
+        entries = []
+        total = 0
+        stale = time.time() - STALE_TEMPORARY_SECONDS
+        for filename in self.directory.glob("*.tmp"):
+            try:
+                stat = filename.stat()
+                if stat.st_mtime < stale:
+                    filename.unlink()
+                else:
+                    total += stat.st_size
+            except FileNotFoundError:
+                continue
+        for filename in self.directory.glob("*.npz"):
+            try:
+                stat = filename.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, filename))
+        total += sum(size for _, size, _ in entries)
+        target = self.max_bytes if total <= self.max_bytes else EVICTION_TARGET * self.max_bytes
+        for _, size, filename in sorted(entries):
+            if total <= target:
+                break
+            try:
+                filename.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+    def clear(self):
+        for filename in self.directory.glob("*.npz"):
+            try:
+                filename.unlink()
+            except FileNotFoundError:
+                pass
+        self.total_bytes = None
+
+
+def get_profile_cache(cache):
+    """
+    ProfileCache from a ProfileCache, a directory or None (no caching)
+    """
+    if cache is None or isinstance(cache, ProfileCache):
+        return cache
+    return ProfileCache(cache)
@@ -0,0 +1,313 @@
+import argparse
+import json
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from clemmys.alignment import ALPHABET, EncodedAlignment
+from clemmys.cache import ProfileCache
+from clemmys.dssp import align_ss_labels, read_ss_file
+from clemmys.glyph import warm_glyph_cache
+from clemmys.links import make_contact_links, make_semicircles
+from clemmys.logo import SequenceLogo
+from clemmys.parallel import get_n_jobs
+from clemmys.readers import iterate_chunks
+from clemmys.secondary_structure import SecondaryStructurePanel
+
+FORMAT_SUFFIXES = {".a3m": "a3m", ".sto": "stockholm", ".stk": "stockholm", ".stockholm": "stockholm"}
+OUTPUT_FORMATS = ("png", "svg", "pdf")
+COLUMN_WIDTH = 0.15
+LOGO_HEIGHT = 2.
+LINKS_HEIGHT = 1.
+SS_HEIGHT = 0.4
+MARGIN = 0.5
+TICKS_HEIGHT = 0.3
+MAX_TICKS = 20
+
+_WORKER = {}
+
+
+def read_manifest(filename) -> list:
+    """
+    Reads a manifest: a JSON list of items, or one JSON item per line
+
+    Each item is a dict with
+        alignment: path to an alignment (fasta, a3m, stockholm, possibly gzipped, or binary)
+        file_format: fasta, a3m, stockholm or binary (default from the suffix, fasta otherwise)
+        output: output path (default alignment name with the output format suffix, in the output directory)
+        positions: [start, stop] window of alignment columns (default all)
+        height, pseudocount: passed to SequenceLogo
+        weights: passed to SequenceLogo, binary alignments only (text formats are counted without keeping sequences)
+        ss: path to a DSSP / DSSP mmCIF file, or labels aligned to the alignment columns
+        ss_key: key of the aligned sequence the ss file belongs to (if ss is a file)
+        links: path to a .npy (L x L) score matrix, or list of [position 1, position 2] pairs
+        k, min_separation, threshold: link selection from a score matrix (default k=50)
+    """
+    text = Path(filename).read_text()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def get_file_format(item) -> str:
+    if "file_format" in item:
+        return item["file_format"]
+    suffixes = Path(item["alignment"]).suffixes
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes = suffixes[:-1]
+    return FORMAT_SUFFIXES.get(suffixes[-1], "fasta") if suffixes else "fasta"
+
+
+def get_output_filename(item, output_dir, output_format) -> Path:
+    if "output" in item:
+        return Path(item["output"])
+    name = Path(item["alignment"]).name.split(".")[0]
+    if "positions" in item:
+        name = f"{name}_{item['positions'][0]}-{item['positions'][1]}"
+    return Path(output_dir) / f"{name}.{output_format}"
+
+
+def get_aligned_sequence(item, key, alignment_length=None) -> str:
+    """
+    Aligned sequence of key, joined from all blocks of an interleaved Stockholm file
+
+    Parameters
+    ----------
+    item
+        manifest item
+    key
+    alignment_length
+        if given, raises a ValueError if the sequence has a different length
+    """
+    file_format = get_file_format(item)
+    if file_format == "binary":
+        alignment = EncodedAlignment.load(item["alignment"])
+        sequence = alignment.decode(alignment.key_index[key])
+    else:
+        segments = {}
+        for offset, _, sequences in iterate_chunks(item["alignment"], file_format, keys=[key]):
+            segments.setdefault(offset, sequences[0])
+        if not segments:
+            raise KeyError(f"{key} not found in {item['alignment']}")
+        sequence = ""
+        for offset in sorted(segments):
+            if offset != len(sequence):
+                raise ValueError(f"{key} has a segment at column {offset} after {len(sequence)} columns")
+            sequence += segments[offset]
+    if alignment_length is not None and len(sequence) != alignment_length:
+        raise ValueError(f"{key} has {len(sequence)} columns, the alignment has {alignment_length}")
+    return sequence
+
+
+def load_logo(item, cache=None) -> SequenceLogo:
+    """
+    SequenceLogo of a manifest item (counts of binary alignments are cached in cache, if given)
+    """
+    positions = range(*item["positions"]) if "positions" in item else None
+    kwargs = {name: item[name] for name in ("height", "weights", "pseudocount") if name in item}
+    file_format = get_file_format(item)
+    if file_format == "binary":
+        return SequenceLogo(EncodedAlignment.load(item["alignment"]), positions=positions, cache=cache, **kwargs)
+    return SequenceLogo.from_file(item["alignment"], file_format, positions=positions, **kwargs)
+
+
+def load_ss_labels(item, logo: SequenceLogo) -> np.ndarray:
+    """
+    ss labels of the logo's positions, as label bytes ('-' for gaps)
+    """
+    ss = item["ss"]
+    if "ss_key" in item:
+        aligned = np.frombuffer(get_aligned_sequence(item, item["ss_key"], logo.alignment_length).encode("ascii"), dtype=np.uint8)
+        residues = ~np.isin(aligned, [ord(c) for c in f"-.{logo.gap_character}"])
+        labels = align_ss_labels(residues, read_ss_file(ss)[1])
+    elif Path(ss).exists():
+        labels = np.frombuffer(read_ss_file(ss)[1].encode("ascii"), dtype=np.uint8)
+    else:
+        labels = np.frombuffer(ss.encode("ascii"), dtype=np.uint8)
+    if len(labels) != logo.alignment_length:
+        raise ValueError(f"ss has {len(labels)} labels for {logo.alignment_length} alignment columns")
+    return labels[logo.positions]
+
+
+def make_links(item, logo: SequenceLogo):
+    """
+    Link collection for the logo's positions, with x positions spaced like the logo's columns
+
+    Returns
+    -------
+    signed heights, LineCollection
+    """
+    positions = np.asarray(logo.positions)
+    if isinstance(item["links"], str):
+        scores = np.load(item["links"], mmap_mode="r")
+        if not np.array_equal(positions, np.arange(logo.alignment_length)):
+            scores = scores[positions[:, None], positions[None, :]]
+        _, heights, links = make_contact_links(scores, k=item.get("k", 50), threshold=item.get("threshold"),
+                                               min_separation=item.get("min_separation", 1), cmap="viridis",
+                                               x_scale=logo.space_between_glyphs)
+        return heights, links
+    column_index = {p: i for i, p in enumerate(positions.tolist())}
+    pairs = np.array([(column_index[p1], column_index[p2]) for p1, p2 in item["links"]
+                      if p1 in column_index and p2 in column_index], dtype=float).reshape(-1, 2)
+    pairs *= logo.space_between_glyphs
+    return make_semicircles(pairs[:, 0], pairs[:, 1], 0., False, "black")
+
+
+def make_template_figure():
+    """
+    Figure (with an Agg canvas, without pyplot) with links, logo and ss axes, reused for every item
+
+    Returns
+    -------
+    Figure, dict of name to Axes
+    """
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = {name: figure.add_axes((0, 0, 1, 1)) for name in ("links", "logo", "ss")}
+    for name in ("links", "ss"):
+        axes[name].set_axis_off()
+    return figure, axes
+
+
+def clear_axes(ax):
+    """
+    Removes the artists added for the previous item, keeping the Axes and its decorations
+    """
+    for artist in [*ax.collections, *ax.patches, *ax.lines, *ax.texts, *ax.artists]:
+        artist.remove()
+
+
+def layout_figure(figure, axes, num_columns, has_links, has_ss, column_width=COLUMN_WIDTH):
+    """
+    Resizes the figure for num_columns and stacks the used axes (links above, ss below the logo)
+    """
+    heights = {"links": LINKS_HEIGHT if has_links else 0., "logo": LOGO_HEIGHT, "ss": SS_HEIGHT if has_ss else 0.}
+    width = column_width * num_columns + 2 * MARGIN
+    total = sum(heights.values()) + 2 * MARGIN + (TICKS_HEIGHT if has_ss else 0.)
+    figure.set_size_inches(width, total)
+    bottom = MARGIN
+    for name in ("ss", "logo", "links"):
+        axes[name].set_visible(heights[name] > 0)
+        axes[name].set_position((MARGIN / width, bottom / total, 1 - 2 * MARGIN / width, heights[name] / total))
+        bottom += heights[name]
+        if name == "ss" and has_ss:
+            # leaves room for the logo's tick labels
+            bottom += TICKS_HEIGHT
+
+
+def render_item(item, figure, axes, output_filename, dpi=100, column_width=COLUMN_WIDTH, cache=None):
+    """
+    Renders one manifest item on the template figure and saves it
+    """
+    logo = load_logo(item, cache)
+    num_columns = len(logo.positions)
+    has_links, has_ss = "links" in item, "ss" in item
+    for ax in axes.values():
+        clear_axes(ax)
+    layout_figure(figure, axes, num_columns, has_links, has_ss, column_width)
+    xlim = (-0.5 * logo.glyph_width, logo.space_between_glyphs * (num_columns - 1) + 0.5 * logo.glyph_width)
+
+    axes["logo"].add_collection(logo.make_collection())
+    axes["logo"].set_xlim(*xlim)
+    axes["logo"].set_ylim(0, max(logo.heights.sum(axis=1).max(initial=0.), 1e-6))
+    step = max(1, int(np.ceil(num_columns / MAX_TICKS)))
+    ticks = np.arange(0, num_columns, step)
+    axes["logo"].set_xticks(logo.space_between_glyphs * ticks, [str(logo.positions[i]) for i in ticks])
+
+    if has_links:
+        heights, links = make_links(item, logo)
+        axes["links"].add_collection(links)
+        axes["links"].set_xlim(*xlim)
+        axes["links"].set_ylim(0, max(heights.max(initial=0.), 1.))
+    if has_ss:
+        panel = SecondaryStructurePanel([load_ss_labels(item, logo)], x=-0.5 * logo.space_between_glyphs)
+        for collection in panel.make_collections():
+            axes["ss"].add_collection(collection)
+        axes["ss"].set_xlim(*xlim)
+        axes["ss"].set_ylim(-0.5, panel.style.width + 0.5)
+    output_filename.parent.mkdir(parents=True, exist_ok=True)
+    figure.savefig(output_filename, dpi=dpi)
+
+
+def _init_worker(options):
+    """
+    Sets up a worker process: warms the glyph cache and builds the template figure
+    """
+    warm_glyph_cache(ALPHABET)
+    figure, axes = make_template_figure()
+    cache = None if options["cache_dir"] is None else ProfileCache(options["cache_dir"])
+    _WORKER.update(options=options, figure=figure, axes=axes, cache=cache)
+
+
+def _render(indexed_item):
+    index, item = indexed_item
+    options = _WORKER["options"]
+    start = time.perf_counter()
+    try:
+        output_filename = get_output_filename(item, options["output_dir"], options["output_format"])
+        render_item(item, _WORKER["figure"], _WORKER["axes"], output_filename, options["dpi"], options["column_width"],
+                    _WORKER["cache"])
+        return index, str(output_filename), None, time.perf_counter() - start
+    except Exception as e:
+        message = "".join(traceback.format_exception_only(type(e), e)).strip()
+        return index, None, message, time.perf_counter() - start
+
+
+def render_manifest(items, output_dir=".", output_format="png", dpi=100, column_width=COLUMN_WIDTH, n_jobs=None,
+                    cache_dir=None):
+    """
+    Renders manifest items in a process pool, each worker reusing one template figure
+    (and sharing the count cache in cache_dir, if given)
+
+    Returns
+    -------
+    list of (index, output filename or None, error message or None, seconds), in manifest order
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}")
+    options = dict(output_dir=output_dir, output_format=output_format, dpi=dpi, column_width=column_width,
+                   cache_dir=cache_dir)
+    n_jobs = min(get_n_jobs(n_jobs), max(1, len(items)))
+    if n_jobs == 1:
+        _init_worker(options)
+        return [_render(indexed_item) for indexed_item in enumerate(items)]
+    chunksize = max(1, len(items) // (n_jobs * 16))
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(options,)) as executor:
+        return list(executor.map(_render, enumerate(items), chunksize=chunksize))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="clemmys", description="Render sequence logos listed in a manifest")
+    parser.add_argument("manifest", help="JSON list of items, or one JSON item per line")
+    parser.add_argument("-o", "--output-dir", default=".", help="directory for outputs without an output path")
+    parser.add_argument("-f", "--format", default="png", choices=OUTPUT_FORMATS, help="output format")
+    parser.add_argument("-j", "--n-jobs", type=int, default=None, help="number of processes (default all CPUs)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--column-width", type=float, default=COLUMN_WIDTH, help="inches per alignment column")
+    parser.add_argument("--cache-dir", default=None, help="cache counts of binary alignments in this directory")
+    parser.add_argument("--report", default=None, help="write per-item results to this JSON file")
+    args = parser.parse_args(argv)
+
+    items = read_manifest(args.manifest)
+    start = time.perf_counter()
+    results = render_manifest(items, args.output_dir, args.format, args.dpi, args.column_width, args.n_jobs,
+                              args.cache_dir)
+    elapsed = time.perf_counter() - start
+    failures = [(index, error) for index, _, error, _ in results if error is not None]
+    num_rendered = len(results) - len(failures)
+    for index, error in failures:
+        print(f"failed: item {index} ({items[index].get('alignment')}): {error}", file=sys.stderr)
+    print(f"rendered {num_rendered}/{len(results)} logos in {elapsed:.2f}s "
+          f"({num_rendered / elapsed if elapsed > 0 else 0.:.2f} logos/s), {len(failures)} failed")
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump({"seconds": elapsed, "rendered": num_rendered, "failed": len(failures),
+                       "items": [{"index": index, "output": output, "error": error, "seconds": seconds}
+                                 for index, output, error, seconds in results]}, f, indent=1)
+    return 1 if failures else 0
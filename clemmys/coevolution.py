@@ -0,0 +1,205 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from clemmys.alignment import EncodedAlignment, get_chunk_size
+from clemmys.parallel import get_n_jobs
+
+MAX_BLOCK_BYTES = 1 << 28
+
+
+def one_hot(block: np.ndarray, alphabet_size: int, dtype=np.float32) -> np.ndarray:
+    """
+    One-hot encodes a (N x c) block of alphabet indices
+
+    Returns
+    -------
+    (N x c * alphabet_size) matrix, column j * alphabet_size + a is 1 where block[:, j] == a
+    """
+    num_rows, num_columns = block.shape
+    encoded = np.zeros((num_rows, num_columns * alphabet_size), dtype=dtype)
+    indices = block.astype(np.intp) + np.arange(num_columns, dtype=np.intp) * alphabet_size
+    np.put_along_axis(encoded, indices, 1, axis=1)
+    return encoded
+
+
+def get_compact_alphabet(matrix: np.ndarray, alphabet_size: int):
+    """
+    Maps alphabet indices to a compact range covering only the characters that occur in matrix
+
+    Returns
+    -------
+    lookup array (index it with matrix), compact alphabet size
+    """
+    occurrences = np.zeros(alphabet_size, dtype=np.int64)
+    chunk_size = get_chunk_size(matrix.shape[1])
+    for start in range(0, matrix.shape[0], chunk_size):
+        occurrences += np.bincount(matrix[start: start + chunk_size].ravel(), minlength=alphabet_size)
+    used = np.flatnonzero(occurrences)
+    compact = np.zeros(alphabet_size, dtype=np.uint8)
+    compact[used] = np.arange(len(used), dtype=np.uint8)
+    return compact, len(used)
+
+
+def get_block_size(num_rows, alphabet_size, max_block_bytes=MAX_BLOCK_BYTES):
+    """
+    Number of columns per block so that a (float32) one-hot block
+    and a (float64) joint frequency block each take at most about max_block_bytes
+    """
+    one_hot_columns = max_block_bytes // (4 * max(1, num_rows) * alphabet_size)
+    joint_columns = int(np.sqrt(max_block_bytes / 8)) // alphabet_size
+    return max(1, min(one_hot_columns, joint_columns))
+
+
+def plogp(p: np.ndarray) -> np.ndarray:
+    """
+    p * log(p), with 0 * log(0) = 0
+    """
+    return p * np.log(np.where(p > 0, p, 1.))
+
+
+def mutual_information(alignment: EncodedAlignment, weights=None, rows=None, apc=True,
+                       block_size=None, n_jobs=1) -> np.ndarray:
+    """
+    Computes mutual information between all pairs of columns,
+    using one-hot matrix products over blocks of columns
+
+    Parameters
+    ----------
+    alignment
+        EncodedAlignment
+    weights
+        per-row sequence weights (None => all 1)
+    rows
+        row indices to use (None => all rows)
+    apc
+        if True, applies the average product correction
+    block_size
+        number of columns per block (None => chosen to keep blocks at about MAX_BLOCK_BYTES)
+    n_jobs
+        number of threads to process blocks with (None or -1 => all CPUs)
+
+    Returns
+    -------
+    (alignment length x alignment length) symmetric matrix with zero diagonal
+    """
+    matrix = alignment.matrix if rows is None else alignment.matrix[rows]
+    num_rows, length = matrix.shape
+    if weights is None:
+        weights = np.ones(num_rows, dtype=np.float64)
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+
+    compact, alphabet_size = get_compact_alphabet(matrix, len(alignment.alphabet))
+    total_weight = weights.sum()
+    row_weights = weights.astype(np.float32)[:, None]
+
+    if block_size is None:
+        block_size = get_block_size(num_rows, alphabet_size)
+    starts = list(range(0, length, block_size))
+
+    def get_one_hot(start):
+        return one_hot(compact[matrix[:, start: start + block_size]], alphabet_size)
+
+    # MI(i, j) = H(i) + H(j) - H(i, j)
+    entropies = np.zeros(length)
+    for start in starts:
+        frequencies = (get_one_hot(start) * row_weights).sum(axis=0, dtype=np.float64) / total_weight
+        entropies[start: start + block_size] = -plogp(frequencies).reshape(-1, alphabet_size).sum(axis=1)
+
+    mi = np.zeros((length, length))
+
+    def process_block_row(start_1):
+        weighted_1 = get_one_hot(start_1) * row_weights
+        size_1 = weighted_1.shape[1] // alphabet_size
+        for start_2 in starts:
+            if start_2 < start_1:
+                continue
+            joint = (weighted_1.T @ get_one_hot(start_2)).astype(np.float64) / total_weight
+            size_2 = joint.shape[1] // alphabet_size
+            joint_entropies = -plogp(joint).reshape(size_1, alphabet_size, size_2, alphabet_size).sum(axis=(1, 3))
+            block_mi = (entropies[start_1: start_1 + size_1, None] + entropies[None, start_2: start_2 + size_2]
+                        - joint_entropies)
+            mi[start_1: start_1 + size_1, start_2: start_2 + size_2] = block_mi
+            mi[start_2: start_2 + size_2, start_1: start_1 + size_1] = block_mi.T
+
+    n_jobs = get_n_jobs(n_jobs)
+    if n_jobs == 1:
+        for start in starts:
+            process_block_row(start)
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(process_block_row, starts))
+
+    np.fill_diagonal(mi, 0.)
+    if apc and length > 1:
+        mean_mi = mi.sum(axis=0) / (length - 1)
+        # no correction (instead of 0 / 0) when no columns share information, e.g. all are constant
+        if mean_mi.mean() > 0:
+            mi -= np.outer(mean_mi, mean_mi) / mean_mi.mean()
+            np.fill_diagonal(mi, 0.)
+    return mi
+
+
+def top_pairs(scores: np.ndarray, k: int, min_separation=1) -> list:
+    """
+    Selects the k highest scoring pairs (i < j) of a symmetric score matrix
+
+    Parameters
+    ----------
+    scores
+        (L x L) symmetric matrix
+    k
+        number of pairs
+    min_separation
+        only consider pairs with j - i >= min_separation
+
+    Returns
+    -------
+    list of (i, j) tuples, highest scoring first
+    """
+    indices_1, indices_2 = np.triu_indices(scores.shape[0], k=max(1, min_separation))
+    values = scores[indices_1, indices_2]
+    if k < len(values):
+        selected = np.argpartition(-values, k)[:k]
+    else:
+        selected = np.arange(len(values))
+    selected = selected[np.argsort(-values[selected], kind="stable")]
+    return list(zip(indices_1[selected].tolist(), indices_2[selected].tolist()))
+
+
+def find_coevolving_positions(alignment, k=50, min_separation=1, keys=None, weights=None, apc=True,
+                              gap_character='X', block_size=None, n_jobs=1) -> list:
+    """
+    Finds the top k coevolving pairs of positions by (APC-corrected) mutual information
+
+    Parameters
+    ----------
+    alignment
+        dict of keys to aligned sequences, or an EncodedAlignment
+    k
+        number of pairs to return
+    min_separation
+        minimum distance between positions in a pair
+    keys
+        give a list to restrict keys (None => all keys used)
+    weights
+        per-key sequence weights, in the order of keys (None => all 1)
+    apc
+        if True, applies the average product correction
+    gap_character
+        character to represent gaps (ignored if alignment is an EncodedAlignment)
+    block_size
+        number of columns per block (None => chosen automatically)
+    n_jobs
+        number of threads (None or -1 => all CPUs)
+
+    Returns
+    -------
+    list of (position 1, position 2) tuples, to use as coevolving_positions in CoevolutionLogo
+    """
+    if not isinstance(alignment, EncodedAlignment):
+        alignment = EncodedAlignment.from_dict(alignment, gap_character=gap_character)
+    scores = mutual_information(alignment, weights=weights, rows=alignment.get_rows(keys), apc=apc,
+                                block_size=block_size, n_jobs=n_jobs)
+    return top_pairs(scores, k, min_separation)
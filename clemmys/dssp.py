@@ -0,0 +1,235 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from clemmys.alignment import ALPHABET, EncodedAlignment
+from clemmys.parallel import BLOCKS_PER_JOB, get_n_jobs
+from clemmys.readers import open_alignment_file
+
+DSSP_HEADER = "  #  RESIDUE AA STRUCTURE"
+MMCIF_CATEGORY = "_dssp_struct_summary."
+SS_FORMATS = ("dssp", "mmcif")
+SS_SUFFIXES = (".dssp", ".mkdssp", ".cif", ".mmcif")
+ALIGNMENT_GAPS = "-."
+THREE_TO_ONE = {"ALA": "A", "ARG": "R", "ASN": "N", "ASP": "D", "CYS": "C",
+                "GLN": "Q", "GLU": "E", "GLY": "G", "HIS": "H", "ILE": "I",
+                "LEU": "L", "LYS": "K", "MET": "M", "PHE": "F", "PRO": "P",
+                "SER": "S", "THR": "T", "TRP": "W", "TYR": "Y", "VAL": "V",
+                "SEC": "U", "PYL": "O", "MSE": "M"}
+
+
+def get_ss_format(filename):
+    """
+    dssp or mmcif, from the file suffix (ignoring .gz)
+    """
+    suffixes = Path(filename).suffixes
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes = suffixes[:-1]
+    return "mmcif" if suffixes and suffixes[-1] in (".cif", ".mmcif") else "dssp"
+
+
+def read_dssp(file, chain=None):
+    """
+    Reads residues and secondary structure labels from classic DSSP output, skipping chain breaks
+
+    Parameters
+    ----------
+    file
+        open text file
+    chain
+        chain identifier to read (None => all chains)
+
+    Returns
+    -------
+    sequence, ss labels (strings of the same length, coil as C)
+    """
+    text = file.read()
+    start = text.find(DSSP_HEADER)
+    if start == -1:
+        raise ValueError("No DSSP residue section found")
+    lines = [line for line in text[start:].splitlines()[1:] if len(line) > 16 and line[13] != '!']
+    if chain is not None:
+        lines = [line for line in lines if line[11] == chain]
+    # lower-case residues are cysteines forming disulfide bridges
+    sequence = "".join(line[13] for line in lines)
+    sequence = sequence.translate(str.maketrans("abcdefghijklmnopqrstuvwxyz", "C" * 26))
+    return sequence, "".join(line[16] for line in lines).replace(" ", "C")
+
+
+def read_dssp_mmcif(file, chain=None):
+    """
+    Reads residues and secondary structure labels from the _dssp_struct_summary category
+    of mmCIF files written by DSSP 4
+
+    Parameters
+    ----------
+    file
+        open text file
+    chain
+        label_asym_id of the chain to read (None => all chains)
+
+    Returns
+    -------
+    sequence, ss labels (strings of the same length, coil as C)
+    """
+    text = file.read()
+    start = text.find(MMCIF_CATEGORY)
+    if start == -1:
+        raise ValueError(f"No {MMCIF_CATEGORY[:-1]} category found")
+    fields, rows = [], []
+    for line in text[start:].splitlines():
+        if line.startswith(MMCIF_CATEGORY):
+            fields.append(line[len(MMCIF_CATEGORY):].strip())
+        elif not line.strip() or line.startswith(("#", "loop_", "_")):
+            break
+        else:
+            rows.append(line.split())
+    residue_column, chain_column = fields.index("label_comp_id"), fields.index("label_asym_id")
+    ss_column = fields.index("secondary_structure")
+    if chain is not None:
+        rows = [row for row in rows if row[chain_column] == chain]
+    sequence = "".join(THREE_TO_ONE.get(row[residue_column], "X") for row in rows)
+    return sequence, "".join(row[ss_column] for row in rows).replace(".", "C").replace("?", "C")
+
+
+def read_ss_file(filename, file_format=None, chain=None):
+    """
+    Reads residues and secondary structure labels from a (gzipped) DSSP or DSSP mmCIF file
+
+    Parameters
+    ----------
+    filename
+    file_format
+        dssp or mmcif (None => from the file suffix, .cif and .mmcif are mmcif)
+    chain
+        chain to read (None => all chains)
+
+    Returns
+    -------
+    sequence, ss labels
+    """
+    if file_format is None:
+        file_format = get_ss_format(filename)
+    if file_format not in SS_FORMATS:
+        raise ValueError(f"file_format must be one of {SS_FORMATS}")
+    with open_alignment_file(filename) as f:
+        if file_format == "dssp":
+            return read_dssp(f, chain)
+        return read_dssp_mmcif(f, chain)
+
+
+def align_ss_labels(residues: np.ndarray, ss_labels: str, gap_label='-') -> np.ndarray:
+    """
+    Places ss labels at the residue columns of an aligned sequence
+
+    Parameters
+    ----------
+    residues
+        boolean array, True for alignment columns with a residue
+    ss_labels
+        one label per residue
+    gap_label
+        label of gap columns
+
+    Returns
+    -------
+    uint8 array of label bytes, one per alignment column
+    """
+    if residues.sum() != len(ss_labels):
+        raise ValueError(f"Aligned sequence has {residues.sum()} residues but {len(ss_labels)} ss labels were read")
+    aligned = np.full(len(residues), ord(gap_label), dtype=np.uint8)
+    aligned[residues] = np.frombuffer(ss_labels.encode("ascii"), dtype=np.uint8)
+    return aligned
+
+
+def find_ss_file(directory: Path, key, suffixes=SS_SUFFIXES):
+    """
+    First existing file named key + suffix (or key + suffix + .gz) in directory
+    """
+    for suffix in suffixes:
+        for filename in (directory / f"{key}{suffix}", directory / f"{key}{suffix}.gz"):
+            if filename.exists():
+                return filename
+    return None
+
+
+def _read_ss_block(directory, keys, residues, suffixes, chain, gap_label):
+    labels = np.full(residues.shape, ord(gap_label), dtype=np.uint8)
+    failed = {}
+    for i, key in enumerate(keys):
+        filename = find_ss_file(directory, key, suffixes)
+        if filename is None:
+            failed[key] = "file not found"
+            continue
+        try:
+            _, ss_labels = read_ss_file(filename, chain=chain)
+            labels[i] = align_ss_labels(residues[i], ss_labels, gap_label)
+        except (ValueError, IndexError, OSError) as e:
+            failed[key] = str(e)
+    return labels, failed
+
+
+def get_residue_mask(alignment, keys) -> np.ndarray:
+    """
+    Boolean (number of keys x alignment length) matrix, True where a sequence has a residue
+    (an EncodedAlignment needs a gap character that is not also a residue, e.g. gap_character='-')
+    """
+    if isinstance(alignment, EncodedAlignment):
+        if alignment.gap_character.upper() in ALPHABET:
+            raise ValueError(f"Gaps are encoded as the residue {alignment.gap_character!r}, "
+                             f"encode the alignment with gap_character='-' to tell them apart")
+        return alignment.matrix[alignment.get_rows(keys)] != alignment.gap_index
+    gaps = np.zeros(256, dtype=bool)
+    gaps[[ord(c) for c in ALIGNMENT_GAPS]] = True
+    return np.array([~gaps[np.frombuffer(alignment[key].encode("ascii"), dtype=np.uint8)] for key in keys],
+                    dtype=bool).reshape(len(keys), -1)
+
+
+def read_ss_directory(directory, alignment, keys=None, suffixes=SS_SUFFIXES, chain=None, gap_label='-',
+                      n_jobs=None):
+    """
+    Reads DSSP / DSSP mmCIF files named after alignment keys (key + suffix, optionally gzipped) in a process pool,
+    into a label matrix aligned to the alignment (e.g. for SecondaryStructurePanel)
+
+    Parameters
+    ----------
+    directory
+        directory with one file per key
+    alignment
+        dict of keys to aligned sequences (gaps as - or .),
+        or an EncodedAlignment with a gap character that is not a residue (e.g. gap_character='-')
+    keys
+        give a list to restrict keys (None => all keys used)
+    suffixes
+        file suffixes to try, in order
+    chain
+        chain to read (None => all chains)
+    gap_label
+        label of gap columns, and of all columns of keys whose file could not be read
+    n_jobs
+        number of processes (None or -1 => all CPUs)
+
+    Returns
+    -------
+    (number of keys x alignment length) uint8 matrix of label bytes,
+    dict of key to error message for keys whose file could not be read
+    """
+    directory = Path(directory)
+    if keys is None:
+        keys = list(alignment.keys) if isinstance(alignment, EncodedAlignment) else list(alignment)
+    residues = get_residue_mask(alignment, keys)
+    n_jobs = get_n_jobs(n_jobs)
+    if n_jobs == 1:
+        return _read_ss_block(directory, keys, residues, suffixes, chain, gap_label)
+    bounds = np.linspace(0, len(keys), min(max(1, len(keys)), n_jobs * BLOCKS_PER_JOB) + 1).astype(int)
+    labels, failed = [], {}
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(_read_ss_block, directory, keys[start: stop], residues[start: stop],
+                                   suffixes, chain, gap_label)
+                   for start, stop in zip(bounds[:-1], bounds[1:])]
+        for future in futures:
+            block_labels, block_failed = future.result()
+            labels.append(block_labels)
+            failed.update(block_failed)
+    return np.concatenate(labels), failed
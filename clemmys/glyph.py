@@ -1,15 +1,155 @@
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 
 import typing
+import numpy as np
+from matplotlib import collections as m_collections
+from matplotlib import colors as m_colors
 from matplotlib import patches as m_patches
 from matplotlib.font_manager import FontProperties
+from matplotlib.path import Path as m_Path
 from matplotlib.textpath import TextPath
 from matplotlib.transforms import Bbox, Affine2D
 
+from clemmys.instrumentation import count, stage, timed
+
 """
 Code adapted from https://github.com/jbkinney/logomaker"
 """
 
+
+@dataclass(frozen=True)
+class GlyphOutline:
+    """
+    Unit-size (size=1, origin (0, 0)) outline of a character, with its extents
+    and the extents of the character it should not be stretched more than
+    """
+    path: m_Path
+    extents: Bbox
+    reference_extents: Bbox
+
+
+class GlyphOutlineCache:
+    """
+    Process-wide LRU cache of glyph outlines,
+    keyed by (character, font name, font weight, dont_stretch_more_than character)
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        Parameters
+        ----------
+        maxsize
+            maximum number of outlines kept (least recently used are evicted first)
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._outlines = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    @timed("glyph.outline")
+    def make_outline(character, font_name='sans', font_weight='normal', dont_stretch_more_than='E'):
+        """
+        Extracts the font outline of a character (uncached)
+
+        Returns
+        -------
+        GlyphOutline
+        """
+        font_properties = FontProperties(family=font_name, weight=font_weight)
+        text_path = TextPath((0, 0), character, size=1, prop=font_properties)
+        path = m_Path(text_path.vertices, text_path.codes, readonly=True)
+        if dont_stretch_more_than == character:
+            reference_extents = path.get_extents()
+        else:
+            reference_extents = TextPath((0, 0), dont_stretch_more_than, size=1,
+                                         prop=font_properties).get_extents()
+        return GlyphOutline(path, path.get_extents(), reference_extents)
+
+    def get(self, character, font_name='sans', font_weight='normal', dont_stretch_more_than='E'):
+        """
+        Get the outline of a character, extracting it from the font only on a cache miss
+
+        Returns
+        -------
+        GlyphOutline
+        """
+        key = (character, font_name, font_weight, dont_stretch_more_than)
+        with self._lock:
+            outline = self._outlines.get(key)
+            if outline is not None:
+                self._outlines.move_to_end(key)
+                self.hits += 1
+                count("glyph_cache.hits")
+                return outline
+            self.misses += 1
+        count("glyph_cache.misses")
+        outline = self.make_outline(*key)
+        with self._lock:
+            self._outlines[key] = outline
+            self._outlines.move_to_end(key)
+            while len(self._outlines) > self.maxsize:
+                self._outlines.popitem(last=False)
+        return outline
+
+    def warm(self, characters, font_name='sans', font_weight='normal', dont_stretch_more_than='E'):
+        """
+        Pre-extract outlines for a collection of characters (e.g. an alphabet)
+        without counting towards hits and misses
+        """
+        for character in characters:
+            key = (character, font_name, font_weight, dont_stretch_more_than)
+            with self._lock:
+                if key in self._outlines:
+                    continue
+            outline = self.make_outline(*key)
+            with self._lock:
+                self._outlines[key] = outline
+                while len(self._outlines) > self.maxsize:
+                    self._outlines.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all outlines and reset statistics
+        """
+        with self._lock:
+            self._outlines.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Returns
+        -------
+        dict with hits, misses, size and maxsize
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        size=len(self._outlines), maxsize=self.maxsize)
+
+
+GLYPH_CACHE = GlyphOutlineCache()
+
+
+def get_glyph_outline(character, font_name='sans', font_weight='normal', dont_stretch_more_than='E'):
+    return GLYPH_CACHE.get(character, font_name, font_weight, dont_stretch_more_than)
+
+
+def warm_glyph_cache(characters, font_name='sans', font_weight='normal', dont_stretch_more_than='E'):
+    GLYPH_CACHE.warm(characters, font_name, font_weight, dont_stretch_more_than)
+
+
+def clear_glyph_cache():
+    GLYPH_CACHE.clear()
+
+
+def glyph_cache_stats() -> dict:
+    return GLYPH_CACHE.stats()
+
+
 @dataclass
 class Glyph:
     character: chr
@@ -28,6 +168,24 @@ class Glyph:
     opacity: float = 1.
 
     def make_patch(self):
+        char_path = self.make_path()
+        if char_path is None:
+            return None
+
+        # Convert char_path to a patch, which can now be drawn on demand
+        count("artists.patches")
+        return m_patches.PathPatch(char_path,
+                                   facecolor=self.color,
+                                   zorder=self.zorder,
+                                   alpha=self.opacity,
+                                   edgecolor=self.edgecolor,
+                                   linewidth=self.edgewidth)
+
+    @timed("glyph.transform")
+    def make_path(self):
+        """
+        Path of the character, scaled and translated into its bounding box (None if height is zero)
+        """
         height = self.y1 - self.y0
         # If height is zero, return None
         if height == 0.0:
@@ -44,24 +202,14 @@ class Glyph:
                                 char_width,
                                 char_height)
 
-        # Set font properties of Glyph
-        font_properties = FontProperties(family=self.font_name,
-                                         weight=self.font_weight)
-
-        # Create a path for Glyph that does not yet have the correct
-        # position or scaling
-        tmp_path = TextPath((0, 0), self.character,
-                            size=1,
-                            prop=font_properties)
-
-        # Create create a corresponding path for a glyph representing
-        # the max stretched character
-        msc_path = TextPath((0, 0), self.dont_stretch_more_than, size=1,
-                            prop=font_properties)
-
-        # Get bounding box for temporary character and max_stretched_character
-        tmp_bbox = tmp_path.get_extents()
-        msc_bbox = msc_path.get_extents()
+        # Get the (cached) path for Glyph that does not yet have the correct
+        # position or scaling, along with its bounding box and the bounding box
+        # of the max stretched character
+        outline = get_glyph_outline(self.character, self.font_name, self.font_weight,
+                                    self.dont_stretch_more_than)
+        tmp_path = outline.path
+        tmp_bbox = outline.extents
+        msc_bbox = outline.reference_extents
 
         # Compute horizontal stretch factor needed for tmp_path
         hstretch_tmp = bbox.width / tmp_bbox.width
@@ -93,12 +241,257 @@ class Glyph:
             .translate(tx=-tmp_bbox.xmin, ty=-tmp_bbox.ymin) \
             .scale(sx=hstretch, sy=vstretch) \
             .translate(tx=bbox.xmin + char_shift, ty=bbox.ymin)
-        char_path = transformation.transform_path(tmp_path)
+        return transformation.transform_path(tmp_path)
 
-        # Convert char_path to a patch, which can now be drawn on demand
-        return m_patches.PathPatch(char_path,
-                                   facecolor=self.color,
-                                   zorder=self.zorder,
-                                   alpha=self.opacity,
-                                   edgecolor=self.edgecolor,
-                                   linewidth=self.edgewidth)
+
+def make_collection(glyphs, zorder=None) -> "GlyphCollection":
+    """
+    Merges many glyphs into a single GlyphCollection
+    (glyphs are drawn in the order given, each with its own face color and opacity;
+    font and edge settings are taken from the first glyph, see GlyphTable.from_glyphs)
+
+    Parameters
+    ----------
+    glyphs
+        iterable of Glyph objects
+    zorder
+        None => the first glyph's zorder
+
+    Returns
+    -------
+    GlyphCollection (add with ax.add_collection)
+    """
+    table = GlyphTable.from_glyphs(glyphs)
+    if zorder is not None:
+        table.zorder = zorder
+    return table.make_collection()
+
+
+class GlyphCollection(m_collections.Collection):
+    """
+    Collection drawing shared unit-size glyph outlines, each with its own affine transform
+    (outline vertices are never copied per glyph)
+    """
+
+    def __init__(self, paths, transforms, **kwargs):
+        """
+        Parameters
+        ----------
+        paths
+            list of unit-size outline paths, one per glyph (may repeat the same path object)
+        transforms
+            (number of glyphs x 3 x 3) affine matrices, in data units
+        kwargs
+            passed to matplotlib Collection (facecolors, edgecolors, linewidths, zorder, ...)
+        """
+        super().__init__(**kwargs)
+        self.set_paths(paths)
+        self._transforms = np.asarray(transforms, dtype=float).reshape(-1, 3, 3)
+        count("artists.collections")
+
+    def draw(self, renderer):
+        with stage("glyph.draw"):
+            super().draw(renderer)
+
+
+@dataclass
+class GlyphTable:
+    """
+    Struct-of-arrays representation of many glyphs (one entry per glyph in each array)
+    """
+    x: np.ndarray
+    y0: np.ndarray
+    y1: np.ndarray
+    width: np.ndarray
+    pad: np.ndarray
+    character: np.ndarray
+    color: np.ndarray
+    opacity: np.ndarray
+    characters: str
+    colors: list
+    font_name: str = 'sans'
+    font_weight: str = 'normal'
+    edgecolor: str = 'black'
+    edgewidth: float = 0.
+    dont_stretch_more_than: chr = 'E'
+    zorder: typing.Union[None, int] = None
+
+    @classmethod
+    def from_arrays(cls, x, y0, y1, character, color, characters, colors, width=0.95, pad=0.1, opacity=1., **kwargs):
+        """
+        Makes a GlyphTable, broadcasting scalar width, pad and opacity
+
+        Parameters
+        ----------
+        x, y0, y1
+            glyph positions
+        character
+            indices into characters
+        color
+            indices into colors
+        characters
+            string (or list) of characters
+        colors
+            list of colors
+        width, pad, opacity
+            scalars or arrays
+        kwargs
+            font_name, font_weight, edgecolor, edgewidth, dont_stretch_more_than, zorder
+        """
+        x = np.asarray(x, dtype=float)
+
+        def as_array(value, dtype=float):
+            return np.broadcast_to(np.asarray(value, dtype=dtype), x.shape)
+        return cls(x, as_array(y0), as_array(y1), as_array(width), as_array(pad),
+                   as_array(character, np.intp), as_array(color, np.intp), as_array(opacity),
+                   characters, list(colors), **kwargs)
+
+    @classmethod
+    def from_glyphs(cls, glyphs):
+        """
+        Makes a GlyphTable from Glyph objects
+        (font, edge and zorder settings are taken from the first glyph)
+        """
+        glyphs = list(glyphs)
+        characters = sorted(set(glyph.character for glyph in glyphs))
+        colors = list(dict.fromkeys(glyph.color for glyph in glyphs))
+        character_index = {character: i for i, character in enumerate(characters)}
+        color_index = {color: i for i, color in enumerate(colors)}
+        kwargs = {}
+        if glyphs:
+            kwargs = dict(font_name=glyphs[0].font_name, font_weight=glyphs[0].font_weight,
+                          edgecolor=glyphs[0].edgecolor, edgewidth=glyphs[0].edgewidth,
+                          dont_stretch_more_than=glyphs[0].dont_stretch_more_than, zorder=glyphs[0].zorder)
+        return cls.from_arrays([glyph.x for glyph in glyphs],
+                               [glyph.y0 for glyph in glyphs],
+                               [glyph.y1 for glyph in glyphs],
+                               [character_index[glyph.character] for glyph in glyphs],
+                               [color_index[glyph.color] for glyph in glyphs],
+                               characters, colors,
+                               width=[glyph.width for glyph in glyphs],
+                               pad=[glyph.pad for glyph in glyphs],
+                               opacity=[glyph.opacity for glyph in glyphs],
+                               **kwargs)
+
+    def __len__(self):
+        return len(self.x)
+
+    def get_outlines(self) -> dict:
+        """
+        Cached unit outlines of the characters used, keyed by character index
+        """
+        return {i: get_glyph_outline(self.characters[i], self.font_name, self.font_weight,
+                                     self.dont_stretch_more_than)
+                for i in np.unique(self.character).tolist()}
+
+    def get_visible(self) -> np.ndarray:
+        """
+        Boolean mask of glyphs with non-zero height
+        """
+        return (self.y1 - self.y0) != 0
+
+    @timed("glyph.affines")
+    def get_affines(self, outlines=None) -> np.ndarray:
+        """
+        Computes the affine transform taking each glyph's unit outline to its bounding box, all at once
+        (same computation as Glyph.make_path)
+
+        Returns
+        -------
+        (number of glyphs x 3 x 3) affine matrices
+        """
+        if outlines is None:
+            outlines = self.get_outlines()
+        num_characters = max(outlines) + 1 if outlines else 0
+        extents = np.ones((num_characters, 4))
+        reference_widths = np.ones(num_characters)
+        for i, outline in outlines.items():
+            extents[i] = outline.extents.bounds
+            reference_widths[i] = outline.reference_extents.width
+        xmin, ymin, tmp_width, tmp_height = extents[self.character].T
+        msc_width = reference_widths[self.character]
+
+        height = self.y1 - self.y0
+        bbox_xmin = self.x - self.width / 2.0
+        bbox_ymin = self.y0 + self.pad * height / 2.0
+        bbox_height = height - self.pad * height
+
+        hstretch = np.minimum(self.width / tmp_width, self.width / msc_width)
+        char_shift = (self.width - hstretch * tmp_width) / 2.0
+        vstretch = bbox_height / tmp_height
+
+        affines = np.zeros((len(self), 3, 3))
+        affines[:, 0, 0] = hstretch
+        affines[:, 1, 1] = vstretch
+        affines[:, 0, 2] = bbox_xmin + char_shift - xmin * hstretch
+        affines[:, 1, 2] = bbox_ymin - ymin * vstretch
+        affines[:, 2, 2] = 1.
+        return affines
+
+    def get_facecolors(self) -> np.ndarray:
+        """
+        (number of glyphs x 4) RGBA face colors, opacity included
+        """
+        facecolors = m_colors.to_rgba_array(self.colors)[self.color]
+        facecolors[:, 3] *= self.opacity
+        return facecolors
+
+    def make_collection(self) -> GlyphCollection:
+        """
+        Single collection of all (visible) glyphs, sharing one outline path per character
+
+        Returns
+        -------
+        GlyphCollection (add with ax.add_collection)
+        """
+        visible = self.get_visible()
+        outlines = self.get_outlines()
+        paths = [outlines[i].path for i in self.character[visible].tolist()]
+        return GlyphCollection(paths, self.get_affines(outlines)[visible],
+                               facecolors=self.get_facecolors()[visible],
+                               edgecolors=self.edgecolor, linewidths=self.edgewidth,
+                               zorder=self.zorder)
+
+    @timed("glyph.transform")
+    def make_paths(self) -> list:
+        """
+        Transformed path per glyph (None for zero-height glyphs),
+        with vertices computed per character in one broadcast operation
+        """
+        outlines = self.get_outlines()
+        affines = self.get_affines(outlines)
+        visible = self.get_visible()
+        paths = [None] * len(self)
+        for i, outline in outlines.items():
+            indices = np.flatnonzero((self.character == i) & visible)
+            scales = affines[indices][:, [0, 1], [0, 1]]
+            translations = affines[indices][:, [0, 1], 2]
+            transformed = outline.path.vertices[None, :, :] * scales[:, None, :] + translations[:, None, :]
+            for index, glyph_vertices in zip(indices.tolist(), transformed):
+                paths[index] = m_Path(glyph_vertices, outline.path.codes)
+        return paths
+
+    def make_patches(self) -> list:
+        """
+        PathPatch per glyph (None for zero-height glyphs), equivalent to Glyph.make_patch
+        """
+        count("artists.patches", int(self.get_visible().sum()))
+        return [None if path is None else m_patches.PathPatch(path,
+                                                                facecolor=self.colors[color],
+                                                                zorder=self.zorder,
+                                                                alpha=opacity,
+                                                                edgecolor=self.edgecolor,
+                                                                linewidth=self.edgewidth)
+                for path, color, opacity in zip(self.make_paths(), self.color.tolist(), self.opacity.tolist())]
+
+    def iterate_glyphs(self):
+        """
+        Iterates over equivalent Glyph objects
+        """
+        for i in range(len(self)):
+            yield Glyph(self.characters[self.character[i]], self.x[i], self.y0[i], self.y1[i],
+                        width=self.width[i], pad=self.pad[i],
+                        font_name=self.font_name, font_weight=self.font_weight,
+                        color=self.colors[self.color[i]], edgecolor=self.edgecolor,
+                        edgewidth=self.edgewidth, dont_stretch_more_than=self.dont_stretch_more_than,
+                        zorder=self.zorder, opacity=self.opacity[i])
@@ -0,0 +1,112 @@
+import numpy as np
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+BACKGROUND_AA = {c: 1 / len(AMINO_ACIDS) for c in AMINO_ACIDS}
+HEIGHT_MODES = ("frequency", "information", "relative_entropy")
+
+
+def get_background_vector(alphabet, background: dict = None) -> np.ndarray:
+    """
+    Background distribution as a vector over the alphabet
+    (zero for characters without a background probability, e.g. gaps)
+
+    Parameters
+    ----------
+    alphabet
+        string of characters
+    background
+        dict of character to probability (None => uniform over the 20 amino acids)
+
+    Returns
+    -------
+    array summing to 1
+    """
+    if background is None:
+        background = BACKGROUND_AA
+    vector = np.array([background.get(c, 0.) for c in alphabet], dtype=np.float64)
+    if vector.sum() <= 0:
+        raise ValueError("Background has no probability for any character in the alphabet")
+    return vector / vector.sum()
+
+
+def get_frequencies(counts: np.ndarray, background_vector: np.ndarray, pseudocount=0.) -> np.ndarray:
+    """
+    Pseudocount-smoothed frequencies of every column: (counts + pseudocount * background) / (total + pseudocount)
+
+    Parameters
+    ----------
+    counts
+        (number of columns x alphabet size) count matrix
+    background_vector
+        from get_background_vector
+    pseudocount
+        total pseudocount weight per column, distributed according to the background
+
+    Returns
+    -------
+    (number of columns x alphabet size) matrix, rows sum to 1 (or 0 for empty columns)
+    """
+    totals = counts.sum(axis=1, keepdims=True) + pseudocount
+    smoothed = counts + pseudocount * background_vector
+    frequencies = np.zeros(smoothed.shape)
+    np.divide(smoothed, totals, out=frequencies, where=totals > 0)
+    return frequencies
+
+
+def get_relative_entropy(frequencies: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """
+    Relative entropy (in bits) of each row of frequencies against a reference distribution,
+    only over characters with non-zero reference probability
+
+    Returns
+    -------
+    array with one value per column
+    """
+    terms = np.zeros(frequencies.shape)
+    valid = (frequencies > 0) & (reference > 0)
+    ratio = np.divide(frequencies, reference, out=np.ones(frequencies.shape), where=valid)
+    np.multiply(frequencies, np.log2(ratio), out=terms, where=valid)
+    return terms.sum(axis=1)
+
+
+def get_heights(counts: np.ndarray, alphabet, mode="frequency", background: dict = None, pseudocount=0.) -> np.ndarray:
+    """
+    Glyph heights for every column and character, computed on the whole count matrix
+
+    Parameters
+    ----------
+    counts
+        (number of columns x alphabet size) (weighted) count matrix
+    alphabet
+        string of characters
+    mode
+        frequency: (smoothed) frequencies of all characters, gaps included, stacking to 1
+        information: information content in bits (relative entropy against a uniform background)
+        relative_entropy: relative entropy in bits against background
+        for information and relative_entropy, characters without background probability (gaps)
+        are not drawn and column heights are scaled by the fraction of such characters
+    background
+        dict of character to probability (None => uniform over the 20 amino acids)
+    pseudocount
+        total pseudocount weight per column, distributed according to the background
+
+    Returns
+    -------
+    (number of columns x alphabet size) matrix of heights
+    """
+    if mode not in HEIGHT_MODES:
+        raise ValueError(f"mode must be one of {HEIGHT_MODES}")
+    background_vector = get_background_vector(alphabet, background)
+    if mode == "frequency":
+        return get_frequencies(counts, background_vector, pseudocount)
+    support = background_vector > 0
+    residue_counts = counts * support
+    frequencies = get_frequencies(residue_counts, background_vector, pseudocount)
+    if mode == "information":
+        reference = support / support.sum()
+    else:
+        reference = background_vector
+    bits = get_relative_entropy(frequencies, reference)
+    totals = counts.sum(axis=1)
+    residue_fraction = np.divide(residue_counts.sum(axis=1), totals, out=np.zeros(len(totals)), where=totals > 0)
+    return frequencies * (bits * residue_fraction)[:, None]
@@ -0,0 +1,172 @@
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+_ACTIVE = None
+_NULL_STAGE = nullcontext()
+
+
+class Instrumentation:
+    """
+    Per-stage wall time and call counts, and named counters, reported into by clemmys while active
+    (see instrument). Stages nest, so the time of a stage includes the time of the stages it calls
+    """
+
+    def __init__(self, callback=None):
+        """
+        Parameters
+        ----------
+        callback
+            called with (stage name, seconds) every time a stage finishes (e.g. to forward to monitoring)
+        """
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counts = defaultdict(int)
+        self.callbacks = [] if callback is None else [callback]
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.seconds[name] += seconds
+            self.calls[name] += 1
+        for callback in self.callbacks:
+            callback(name, seconds)
+
+    def add_count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def get_glyph_cache_hit_rate(self):
+        """
+        Fraction of glyph outline lookups served from the cache (None if there were none)
+        """
+        hits, misses = self.counts.get("glyph_cache.hits", 0), self.counts.get("glyph_cache.misses", 0)
+        return hits / (hits + misses) if hits + misses else None
+
+    def to_dict(self) -> dict:
+        """
+        Returns
+        -------
+        dict with stages (name: seconds and calls), counts (name: count),
+        artists (total number of matplotlib artists created) and glyph_cache_hit_rate
+        """
+        with self._lock:
+            stages = {name: dict(seconds=self.seconds[name], calls=self.calls[name]) for name in self.seconds}
+            counts = dict(self.counts)
+        return dict(stages=stages, counts=counts,
+                    artists=sum(n for name, n in counts.items() if name.startswith("artists.")),
+                    glyph_cache_hit_rate=self.get_glyph_cache_hit_rate())
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def format_table(self) -> str:
+        """
+        Stages sorted by total time, then counts, as text
+        """
+        data = self.to_dict()
+        lines = [f"{'stage':<28} {'calls':>8} {'seconds':>10}"]
+        for name, stage_data in sorted(data["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"{name:<28} {stage_data['calls']:>8} {stage_data['seconds']:>10.4f}")
+        for name, n in sorted(data["counts"].items()):
+            lines.append(f"{name:<28} {n:>8}")
+        if data["glyph_cache_hit_rate"] is not None:
+            lines.append(f"{'glyph cache hit rate':<28} {data['glyph_cache_hit_rate']:>8.3f}")
+        return "\n".join(lines)
+
+
+class Stage:
+    """
+    Context manager timing one call of a stage into an Instrumentation
+    """
+
+    def __init__(self, instrumentation: Instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.add_stage(self.name, time.perf_counter() - self.start)
+
+
+@contextmanager
+def instrument(instrumentation: Instrumentation = None, callback=None):
+    """
+    Records clemmys stages and counts into an Instrumentation for the duration of the block
+    (in this process; the previously active Instrumentation, if any, is restored afterwards)
+
+        with instrument() as instrumentation:
+            logo = SequenceLogo(alignment)
+            ax.add_collection(logo.make_collection())
+        print(instrumentation.to_json())
+
+    Parameters
+    ----------
+    instrumentation
+        Instrumentation to add to (None => a new one)
+    callback
+        added to the Instrumentation's callbacks, see Instrumentation
+
+    Returns
+    -------
+    the active Instrumentation
+    """
+    global _ACTIVE
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+    if callback is not None:
+        instrumentation.add_callback(callback)
+    previous, _ACTIVE = _ACTIVE, instrumentation
+    try:
+        yield instrumentation
+    finally:
+        _ACTIVE = previous
+
+
+def get_instrumentation():
+    """
+    The active Instrumentation (None if not instrumenting)
+    """
+    return _ACTIVE
+
+
+def stage(name):
+    """
+    Context manager timing a stage if instrumenting, a shared no-op context otherwise
+    """
+    if _ACTIVE is None:
+        return _NULL_STAGE
+    return Stage(_ACTIVE, name)
+
+
+def count(name, n=1):
+    """
+    Adds n to a named counter if instrumenting
+    """
+    if _ACTIVE is not None:
+        _ACTIVE.add_count(name, n)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as a stage (only an extra call and check when not instrumenting)
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _ACTIVE is None:
+                return function(*args, **kwargs)
+            with Stage(_ACTIVE, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
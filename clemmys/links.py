@@ -1,7 +1,18 @@
+import heapq
+
 import numpy as np
+from matplotlib import colormaps as m_colormaps
+from matplotlib import collections as m_collections
+from matplotlib import colors as m_colors
 from matplotlib import patches as m_patches
 from matplotlib.path import Path as m_Path
 
+from clemmys.alignment import get_chunk_size
+from clemmys.instrumentation import count, timed
+
+LINK_STYLES = ("semicircle", "curve")
+LAYOUT_MODES = ("stack", "alternate")
+
 
 def make_semicircle(x1: float, x2: float, y: float, valley: bool, color: str, opacity: float = 1., linewidth: float = 1.):
     """
@@ -26,6 +37,7 @@ def make_semicircle(x1: float, x2: float, y: float, valley: bool, color: str, op
     height = 2 * np.abs(x1 - middle)
     if height == 0:
         return 0, None
+    count("artists.patches")
     if valley:
         return -height, m_patches.Arc((middle, y), -height, -height, angle=-180, theta1=180, theta2=360,
                                       lw=linewidth, color=color, alpha=opacity)
@@ -75,6 +87,7 @@ def make_range_semicircle_bracket(x11: float, x12: float, x21: float, x22: float
                                    arrowstyle=m_patches.ArrowStyle.BracketA(widthA=middle_2,
                                                                             lengthA=3,
                                                                             angleA=None))
+    count("artists.patches", 2)
     return height, [p1, p2, p3]
 
 
@@ -98,6 +111,7 @@ def make_connection(x1: float, y1: float, x2: float, y2: float, color: str, opac
     -------
     matplotlib patch
     """
+    count("artists.patches")
     return m_patches.ConnectionPatch((x1, y1), (x2, y2),
                                      "data", "data",
                                      arrowstyle=arrow_style,
@@ -143,6 +157,7 @@ def make_range_connection_bracket(x11: float, x12: float, x21: float, x22: float
                                    arrowstyle=m_patches.ArrowStyle.BracketA(widthA=middle_2,
                                                                             lengthA=3,
                                                                             angleA=None))
+    count("artists.patches", 2)
     return [p1, p2, p3]
 
 
@@ -169,6 +184,7 @@ def make_curve(x1: float, x2: float, y: float, valley: bool, color: str, opacity
     """
     middle = (x1 + x2) // 2
     height = 2 * np.abs(x1 - middle)
+    count("artists.patches")
     if valley:
         return -height, m_patches.FancyArrowPatch(path=m_Path([(x1, y), (middle, y - height), (x2, y)],
                                                               [m_Path.MOVETO, m_Path.CURVE3, m_Path.CURVE3]),
@@ -223,4 +239,575 @@ def make_range_curve_bracket(x11: float, x12: float, x21: float, x22: float, y:
                                    arrowstyle=m_patches.ArrowStyle.BracketA(widthA=middle_2,
                                                                             lengthA=3,
                                                                             angleA=None))
+    count("artists.patches", 2)
     return height, [p1, p2, p3]
+
+
+def get_link_colors(color, opacity, num_links: int) -> np.ndarray:
+    """
+    RGBA colors for a batch of links
+
+    Parameters
+    ----------
+    color
+        single color or one color per link
+    opacity
+        single value or one value per link
+    num_links
+
+    Returns
+    -------
+    (num_links x 4) array
+    """
+    colors = np.broadcast_to(m_colors.to_rgba_array(color), (num_links, 4)).copy()
+    colors[:, 3] *= np.broadcast_to(np.asarray(opacity, dtype=float), num_links)
+    return colors
+
+
+def get_linewidths(linewidth, num_links: int) -> np.ndarray:
+    return np.broadcast_to(np.asarray(linewidth, dtype=float), num_links)
+
+
+def get_signs(valley, num_links: int) -> np.ndarray:
+    """
+    -1 for valley (∪) links, 1 for peak (∩) links
+    """
+    return np.where(np.broadcast_to(np.asarray(valley, dtype=bool), num_links), -1., 1.)
+
+
+def make_semicircle_vertices(x1, x2, y, valley, resolution=64):
+    """
+    Vertices of semicircles between (x1, y) and (x2, y), with the same geometry as make_semicircle
+
+    Returns
+    -------
+    signed heights (as returned by make_semicircle), (number of links x resolution x 2) vertices
+    """
+    x1, x2 = np.asarray(x1, dtype=float), np.asarray(x2, dtype=float)
+    y = np.broadcast_to(np.asarray(y, dtype=float), x1.shape)
+    sign = get_signs(valley, len(x1))
+    middle = (x1 + x2) / 2
+    height = 2 * np.abs(x1 - middle)
+    theta = np.linspace(0, np.pi, resolution)
+    vertices = np.empty((len(x1), resolution, 2))
+    vertices[:, :, 0] = middle[:, None] + height[:, None] / 2 * np.cos(theta)
+    vertices[:, :, 1] = y[:, None] + sign[:, None] * height[:, None] / 2 * np.sin(theta)
+    return sign * height, vertices
+
+
+def make_curve_vertices(x1, x2, y, valley, resolution=32):
+    """
+    Vertices of quadratic Bézier curves between (x1, y) and (x2, y), with the same geometry as make_curve
+
+    Returns
+    -------
+    signed heights (as returned by make_curve), (number of links x resolution x 2) vertices
+    """
+    x1, x2 = np.asarray(x1, dtype=float), np.asarray(x2, dtype=float)
+    y = np.broadcast_to(np.asarray(y, dtype=float), x1.shape)
+    sign = get_signs(valley, len(x1))
+    middle = (x1 + x2) // 2
+    height = 2 * np.abs(x1 - middle)
+    control = y + sign * height
+    t = np.linspace(0, 1, resolution)[None, :]
+    vertices = np.empty((len(x1), resolution, 2))
+    vertices[:, :, 0] = (1 - t) ** 2 * x1[:, None] + 2 * (1 - t) * t * middle[:, None] + t ** 2 * x2[:, None]
+    vertices[:, :, 1] = ((1 - t) ** 2 + t ** 2) * y[:, None] + 2 * (1 - t) * t * control[:, None]
+    return sign * height, vertices
+
+
+BRACKET_CODES = [m_Path.MOVETO, m_Path.LINETO, m_Path.LINETO, m_Path.LINETO, m_Path.MOVETO, m_Path.LINETO]
+
+
+def make_bracket_vertices(start, end, y, y1, tick_length=0.25):
+    """
+    Vertices of brackets from (start, y) to (end, y), with ticks at both ends pointing away from y1
+    and a stem from (middle, y) to (middle, y1)
+
+    Returns
+    -------
+    (number of brackets x 6 x 2) vertices, to be drawn with BRACKET_CODES
+    """
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    y = np.broadcast_to(np.asarray(y, dtype=float), start.shape)
+    y1 = np.broadcast_to(np.asarray(y1, dtype=float), start.shape)
+    tick = y - np.sign(y1 - y) * tick_length
+    middle = (start + end) / 2
+    vertices = np.empty((len(start), 6, 2))
+    vertices[:, :, 0] = np.stack([start, start, end, end, middle, middle], axis=1)
+    vertices[:, :, 1] = np.stack([tick, y, y, tick, y, y1], axis=1)
+    return vertices
+
+
+def make_bracket_collection(vertices, colors, linewidths) -> m_collections.PathCollection:
+    """
+    Unfilled PathCollection with one path (both brackets) per link
+    """
+    codes = np.asarray(BRACKET_CODES * (vertices.shape[1] // len(BRACKET_CODES)), dtype=m_Path.code_type)
+    count("artists.collections")
+    return m_collections.PathCollection([m_Path(link_vertices, codes) for link_vertices in vertices],
+                                        facecolors="none", edgecolors=colors, linewidths=linewidths)
+
+
+@timed("links.semicircles")
+def make_semicircles(x1, x2, y, valley, color, opacity=1., linewidth=1., resolution=64):
+    """
+    Batched make_semicircle: one LineCollection of semicircular links between (x1, y) and (x2, y)
+
+    Parameters
+    ----------
+    x1
+        array of link starts
+    x2
+        array of link ends
+    y
+        single value or array
+    valley
+        single bool or array, if True, ∪ else ∩
+    color
+        single color or one per link
+    opacity
+        single value or array
+    linewidth
+        single value or array
+    resolution
+        number of vertices per semicircle
+
+    Returns
+    -------
+    signed heights of each link (max / min give the axis limits), matplotlib LineCollection
+    (zero-length links are not drawn)
+    """
+    x1 = np.asarray(x1, dtype=float)
+    colors = get_link_colors(color, opacity, len(x1))
+    linewidths = get_linewidths(linewidth, len(x1))
+    heights, vertices = make_semicircle_vertices(x1, x2, y, valley, resolution)
+    drawn = heights != 0
+    count("artists.collections")
+    return heights, m_collections.LineCollection(vertices[drawn], colors=colors[drawn], linewidths=linewidths[drawn])
+
+
+@timed("links.curves")
+def make_curves(x1, x2, y, valley, color, opacity=1., linewidth=1., resolution=32):
+    """
+    Batched make_curve (without arrow heads): one LineCollection of curved links between (x1, y) and (x2, y)
+
+    Parameters
+    ----------
+    x1
+        array of link starts
+    x2
+        array of link ends
+    y
+        single value or array
+    valley
+        single bool or array, if True, ∪ else ∩
+    color
+        single color or one per link
+    opacity
+        single value or array
+    linewidth
+        single value or array
+    resolution
+        number of vertices per curve
+
+    Returns
+    -------
+    signed heights of each link (max / min give the axis limits), matplotlib LineCollection
+    """
+    x1 = np.asarray(x1, dtype=float)
+    heights, vertices = make_curve_vertices(x1, x2, y, valley, resolution)
+    count("artists.collections")
+    return heights, m_collections.LineCollection(vertices, colors=get_link_colors(color, opacity, len(x1)),
+                                                 linewidths=get_linewidths(linewidth, len(x1)))
+
+
+@timed("links.connections")
+def make_connections(x1, y1, x2, y2, color, opacity=1., linewidth=1.):
+    """
+    Batched make_connection (without arrow heads): one LineCollection of lines between (x1, y1) and (x2, y2)
+
+    Returns
+    -------
+    matplotlib LineCollection
+    """
+    x1 = np.asarray(x1, dtype=float)
+    vertices = np.empty((len(x1), 2, 2))
+    vertices[:, 0, 0], vertices[:, 1, 0] = x1, x2
+    vertices[:, 0, 1], vertices[:, 1, 1] = y1, y2
+    count("artists.collections")
+    return m_collections.LineCollection(vertices, colors=get_link_colors(color, opacity, len(x1)),
+                                        linewidths=get_linewidths(linewidth, len(x1)))
+
+
+def make_range_link_brackets(x11, x12, x21, x22, y, valley, tick_length=0.25):
+    """
+    Bracket vertices for batched range links, with stems 1 unit up (or down for valleys) from y
+
+    Returns
+    -------
+    middles of the first ranges, middles of the second ranges, stem ends, (number of links x 12 x 2) vertices
+    """
+    x11, x12, x21, x22 = (np.asarray(x, dtype=float) for x in (x11, x12, x21, x22))
+    y = np.broadcast_to(np.asarray(y, dtype=float), x11.shape)
+    y1 = y + get_signs(valley, len(x11))
+    brackets = np.concatenate([make_bracket_vertices(x11, x21, y, y1, tick_length),
+                               make_bracket_vertices(x12, x22, y, y1, tick_length)], axis=1)
+    return (x11 + x21) / 2, (x12 + x22) / 2, y1, brackets
+
+
+@timed("links.brackets")
+def make_range_semicircle_brackets(x11, x12, x21, x22, y, valley, color, opacity=1., linewidth=1.,
+                                   tick_length=0.25, resolution=64):
+    """
+    Batched make_range_semicircle_bracket: brackets over the ranges x11 to x21 and x12 to x22
+    (the same convention as make_range_semicircle_bracket uses to find their middles), connected by semicircles
+
+    Parameters
+    ----------
+    x11, x12, x21, x22
+        arrays of range ends
+    y
+        single value or array
+    valley
+        single bool or array, if True, ∪ else ∩
+    color
+        single color or one per link
+    opacity
+        single value or array
+    linewidth
+        single value or array
+    tick_length
+        length (in data units) of the ticks at the ends of each bracket
+    resolution
+        number of vertices per semicircle
+
+    Returns
+    -------
+    signed heights of each link (max / min give the axis limits),
+    [PathCollection of brackets, LineCollection of semicircles]
+    """
+    middle_1, middle_2, y1, brackets = make_range_link_brackets(x11, x12, x21, x22, y, valley, tick_length)
+    heights, links = make_semicircles(middle_1, middle_2, y1, valley, color, opacity, linewidth, resolution)
+    colors = get_link_colors(color, opacity, len(brackets))
+    return heights, [make_bracket_collection(brackets, colors, get_linewidths(linewidth, len(brackets))), links]
+
+
+@timed("links.brackets")
+def make_range_curve_brackets(x11, x12, x21, x22, y, valley, color, opacity=1., linewidth=1.,
+                              tick_length=0.25, resolution=32):
+    """
+    Batched make_range_curve_bracket (without arrow heads): brackets over the ranges x11 to x21 and x12 to x22
+    (the same convention as make_range_curve_bracket uses to find their middles), connected by curves
+
+    Parameters
+    ----------
+    x11, x12, x21, x22
+        arrays of range ends
+    y
+        single value or array
+    valley
+        single bool or array, if True, ∪ else ∩
+    color
+        single color or one per link
+    opacity
+        single value or array
+    linewidth
+        single value or array
+    tick_length
+        length (in data units) of the ticks at the ends of each bracket
+    resolution
+        number of vertices per curve
+
+    Returns
+    -------
+    signed heights of each link (max / min give the axis limits),
+    [PathCollection of brackets, LineCollection of curves]
+    """
+    middle_1, middle_2, y1, brackets = make_range_link_brackets(x11, x12, x21, x22, y, valley, tick_length)
+    heights, links = make_curves(middle_1, middle_2, y1, valley, color, opacity, linewidth, resolution)
+    colors = get_link_colors(color, opacity, len(brackets))
+    return heights, [make_bracket_collection(brackets, colors, get_linewidths(linewidth, len(brackets))), links]
+
+
+@timed("links.brackets")
+def make_range_connection_brackets(x11, x12, x21, x22, y1, y2, color, opacity=1., linewidth=1., tick_length=0.25):
+    """
+    Batched make_range_connection_bracket (without arrow heads): brackets over the ranges x11 to x21 at y1
+    and x12 to x22 at y2 (the same convention as make_range_connection_bracket), connected by lines
+
+    Returns
+    -------
+    [PathCollection of brackets, LineCollection of connections]
+    """
+    x11, x12, x21, x22 = (np.asarray(x, dtype=float) for x in (x11, x12, x21, x22))
+    y1 = np.broadcast_to(np.asarray(y1, dtype=float), x11.shape)
+    y2 = np.broadcast_to(np.asarray(y2, dtype=float), x11.shape)
+    brackets = np.concatenate([make_bracket_vertices(x11, x21, y1, y1 + 1, tick_length),
+                               make_bracket_vertices(x12, x22, y2, y2 + 1, tick_length)], axis=1)
+    colors = get_link_colors(color, opacity, len(brackets))
+    linewidths = get_linewidths(linewidth, len(brackets))
+    connections = make_connections((x11 + x21) / 2, y1 + 1, (x12 + x22) / 2, y2 + 1, color, opacity, linewidth)
+    return [make_bracket_collection(brackets, colors, linewidths), connections]
+
+
+def keep_top_k(indices_1, indices_2, values, k):
+    """
+    Keeps the k highest values (all if k is None), unordered
+    """
+    if k is None or len(values) <= k:
+        return indices_1, indices_2, values
+    if k <= 0:
+        return indices_1[:0], indices_2[:0], values[:0]
+    selected = np.argpartition(-values, k - 1)[:k]
+    return indices_1[selected], indices_2[selected], values[selected]
+
+
+def iterate_candidate_pairs(scores, min_separation=1, threshold=None, chunk_rows=None):
+    """
+    Yields blocks of candidate pairs (i, j) with j - i >= min_separation (and score > threshold)
+    from the upper triangle of a score matrix, without materializing all pairs at once
+
+    Parameters
+    ----------
+    scores
+        (L x L) dense array (possibly memory-mapped), or a sparse matrix (anything with tocoo())
+    min_separation
+        only consider pairs with j - i >= min_separation
+    threshold
+        only consider pairs with score > threshold (None => no threshold)
+    chunk_rows
+        number of rows of a dense matrix to read at a time (None => chosen automatically)
+
+    Yields
+    ------
+    arrays of first indices, second indices, scores
+    """
+    min_separation = max(1, min_separation)
+    if hasattr(scores, "tocoo"):
+        scores = scores.tocoo()
+        indices_1, indices_2 = np.asarray(scores.row, dtype=np.intp), np.asarray(scores.col, dtype=np.intp)
+        values = np.asarray(scores.data, dtype=np.float64)
+        mask = (indices_2 - indices_1) >= min_separation
+        if threshold is not None:
+            mask &= values > threshold
+        yield indices_1[mask], indices_2[mask], values[mask]
+        return
+    length = scores.shape[1]
+    if chunk_rows is None:
+        chunk_rows = get_chunk_size(length)
+    columns = np.arange(length, dtype=np.intp)
+    for start in range(0, max(0, length - min_separation), chunk_rows):
+        stop = min(start + chunk_rows, length - min_separation)
+        # only columns from start + min_separation onwards can be in the upper triangle of this block
+        first_column = start + min_separation
+        block = np.asarray(scores[start: stop, first_column:], dtype=np.float64)
+        rows = np.arange(start, stop, dtype=np.intp)
+        mask = columns[None, first_column:] - rows[:, None] >= min_separation
+        if threshold is not None:
+            mask &= block > threshold
+        block_rows, block_columns = np.nonzero(mask)
+        yield rows[block_rows], block_columns + first_column, block[block_rows, block_columns]
+
+
+@timed("links.select_contacts")
+def select_contacts(scores, k=None, threshold=None, min_separation=1, chunk_rows=None):
+    """
+    Selects the highest scoring pairs (i < j) of a symmetric score matrix, chunk by chunk,
+    keeping only the current top k candidates in memory
+
+    Parameters
+    ----------
+    scores
+        (L x L) dense array (possibly memory-mapped), or a sparse matrix (anything with tocoo());
+        only the upper triangle is used
+    k
+        maximum number of pairs (None => all pairs passing the threshold)
+    threshold
+        only keep pairs with score > threshold (None => no threshold)
+    min_separation
+        only keep pairs with j - i >= min_separation
+    chunk_rows
+        number of rows of a dense matrix to read at a time (None => chosen automatically)
+
+    Returns
+    -------
+    arrays of first positions, second positions and scores, highest scoring first
+    """
+    blocks = []
+    for block in iterate_candidate_pairs(scores, min_separation, threshold, chunk_rows):
+        blocks.append(block)
+        if k is not None and len(blocks) > 1:
+            blocks = [keep_top_k(*(np.concatenate(arrays) for arrays in zip(*blocks)), k)]
+    if not blocks:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0)
+    indices_1, indices_2, values = keep_top_k(*(np.concatenate(arrays) for arrays in zip(*blocks)), k)
+    order = np.lexsort((indices_2, indices_1, -values))
+    return indices_1[order], indices_2[order], values[order]
+
+
+def scale_scores(values, value_range=None) -> np.ndarray:
+    """
+    Scales scores linearly to [0, 1]
+
+    Parameters
+    ----------
+    values
+    value_range
+        (min, max) mapped to 0 and 1 (None => min and max of values), values outside are clipped
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if value_range is None:
+        value_range = (values.min(), values.max()) if len(values) else (0., 1.)
+    low, high = value_range
+    if high <= low:
+        return np.ones(len(values))
+    return np.clip((values - low) / (high - low), 0., 1.)
+
+
+def map_scores(scaled, mapping):
+    """
+    Maps scaled scores to a property: a (min, max) tuple is interpolated, anything else is used as is
+    """
+    if isinstance(mapping, tuple) and len(mapping) == 2:
+        return mapping[0] + scaled * (mapping[1] - mapping[0])
+    return mapping
+
+
+@timed("links.contact_links")
+def make_contact_links(scores, k=None, threshold=None, min_separation=1, style="semicircle",
+                       y=0., valley=False, x_offset=0., color="black", cmap=None, value_range=None,
+                       opacity=1., linewidth=1., resolution=None, chunk_rows=None, x_scale=1.):
+    """
+    Makes batched links for the highest scoring pairs of a (contact / coupling / coevolution) score matrix
+
+    Parameters
+    ----------
+    scores
+        (L x L) dense array (possibly memory-mapped), or a sparse matrix (anything with tocoo());
+        only the upper triangle is used
+    k
+        maximum number of links (None => all pairs passing the threshold)
+    threshold
+        only draw pairs with score > threshold (None => no threshold)
+    min_separation
+        only draw pairs with j - i >= min_separation
+    style
+        semicircle or curve
+    y
+        y position of the links
+    valley
+        single bool or array (in selection order), if True, ∪ else ∩
+    x_offset
+        added to scaled matrix indices to get x positions
+    color
+        single color or one per link, ignored if cmap is given
+    cmap
+        colormap (name or Colormap) to color links by their scaled score
+    value_range
+        (min, max) score mapped to the ends of cmap, opacity and linewidth ranges
+        (None => min and max of the selected scores)
+    opacity
+        single value, or (min, max) tuple to map scaled scores to
+    linewidth
+        single value, or (min, max) tuple to map scaled scores to
+    resolution
+        number of vertices per link (None => default of the style)
+    chunk_rows
+        number of rows of a dense matrix to read at a time (None => chosen automatically)
+    x_scale
+        distance between consecutive matrix indices on the x-axis (e.g. a logo's space_between_glyphs)
+
+    Returns
+    -------
+    (first positions, second positions, scores) of the drawn links, signed heights of each link,
+    matplotlib LineCollection
+    """
+    if style not in LINK_STYLES:
+        raise ValueError(f"style must be one of {LINK_STYLES}")
+    indices_1, indices_2, values = select_contacts(scores, k, threshold, min_separation, chunk_rows)
+    scaled = scale_scores(values, value_range)
+    if cmap is not None:
+        color = m_colormaps[cmap](scaled) if isinstance(cmap, str) else cmap(scaled)
+    kwargs = dict(opacity=map_scores(scaled, opacity), linewidth=map_scores(scaled, linewidth))
+    if resolution is not None:
+        kwargs["resolution"] = resolution
+    make_links = make_semicircles if style == "semicircle" else make_curves
+    heights, links = make_links(x_scale * indices_1 + x_offset, x_scale * indices_2 + x_offset, y, valley, color,
+                                **kwargs)
+    return (indices_1, indices_2, values), heights, links
+
+
+def assign_link_levels(x1, x2, min_gap=0.) -> np.ndarray:
+    """
+    Assigns links (as intervals between their ends) to levels such that links on the same level don't overlap,
+    using the fewest levels possible (a sweep over link starts, O(n log n))
+
+    Parameters
+    ----------
+    x1
+        array of link starts
+    x2
+        array of link ends
+    min_gap
+        links on the same level are at least this far apart (links sharing an end never share a level)
+
+    Returns
+    -------
+    level of each link (0 = lowest free level when the link starts), in input order
+    """
+    x1, x2 = np.asarray(x1, dtype=float), np.asarray(x2, dtype=float)
+    starts, ends = np.minimum(x1, x2), np.maximum(x1, x2)
+    order = np.lexsort((ends, starts))
+    levels = np.zeros(len(starts), dtype=np.intp)
+    active = []  # heap of (end, level) of links in progress
+    free = []  # heap of levels no longer in use
+    num_levels = 0
+    for index, start, end in zip(order.tolist(), starts[order].tolist(), ends[order].tolist()):
+        while active and active[0][0] + min_gap < start:
+            heapq.heappush(free, heapq.heappop(active)[1])
+        if free:
+            level = heapq.heappop(free)
+        else:
+            level = num_levels
+            num_levels += 1
+        levels[index] = level
+        heapq.heappush(active, (end, level))
+    return levels
+
+
+@timed("links.layout")
+def layout_links(x1, x2, mode="stack", y=0., spacing=1., min_gap=0.):
+    """
+    Computes y positions and valley flags for overlapping links,
+    to pass to make_semicircles / make_curves (or, link by link, to make_semicircle / make_curve)
+
+    Parameters
+    ----------
+    x1
+        array of link starts
+    x2
+        array of link ends
+    mode
+        stack: all links are peaks (∩), level n is drawn at y + n * spacing
+        alternate: even levels are peaks and odd levels valleys (∪),
+        level n is drawn at y + (n // 2) * spacing (above y) or y - (n // 2) * spacing (below y)
+    y
+        y position of level 0
+    spacing
+        distance between the bases of consecutive levels on the same side
+    min_gap
+        links on the same level are at least this far apart
+
+    Returns
+    -------
+    y positions, valley flags, levels (one per link, in input order)
+    """
+    if mode not in LAYOUT_MODES:
+        raise ValueError(f"mode must be one of {LAYOUT_MODES}")
+    levels = assign_link_levels(x1, x2, min_gap)
+    if mode == "stack":
+        return y + levels * spacing, np.zeros(len(levels), dtype=bool), levels
+    valley = (levels % 2).astype(bool)
+    offsets = (levels // 2) * spacing
+    return y + np.where(valley, -offsets, offsets), valley, levels
@@ -2,26 +2,113 @@ from collections import Counter
 
 import numpy as np
 
+from clemmys.alignment import EncodedAlignment
+from clemmys.cache import get_cache_key, get_profile_cache
 from clemmys.colors import COLOR_SCHEME_AA
-from clemmys.glyph import Glyph
+from clemmys.glyph import GlyphTable
+from clemmys.information import get_heights
+from clemmys.instrumentation import count, timed
+from clemmys.parallel import parallel_counts
+from clemmys.readers import DEFAULT_CHUNK_SIZE, read_alignment_profile
+from clemmys.svg import SVGWriter, open_svg_file
+from clemmys.weights import get_weights
 
 """
 Code adapted from https://github.com/jbkinney/logomaker"
 """
 
+COLUMN_BLOCK_SIZE = 64
+SVG_COLUMN_WIDTH = 12.
+SVG_HEIGHT = 72.
+
+
+def stack_heights(heights: np.ndarray):
+    """
+    Stacks the non-zero heights of each row, largest on top, from the row's total height down to 0
+
+    Returns
+    -------
+    row indices, column indices, y0 and y1 of the non-zero entries, in drawing order
+    """
+    order = np.argsort(-heights, axis=1, kind="stable")
+    sorted_heights = np.take_along_axis(heights, order, axis=1)
+    y1 = sorted_heights.sum(axis=1, keepdims=True) - np.cumsum(sorted_heights, axis=1) + sorted_heights
+    rows, ranks = np.nonzero(sorted_heights)
+    return rows, order[rows, ranks], y1[rows, ranks] - sorted_heights[rows, ranks], y1[rows, ranks]
+
+
+def count_with_cache(logo, weights, cache, **parameters):
+    """
+    Sets logo.weights and returns logo.get_counts(), loading both from cache if they were stored
+    for the same alignment content and parameters (and storing them otherwise)
+
+    Parameters
+    ----------
+    logo
+        SequenceLogo or CoevolutionLogo, with encoded_alignment, keys and rows set
+    weights
+        weights as passed to the logo
+    cache
+        ProfileCache, cache directory or None (no caching)
+    parameters
+        counting parameters identifying the counts besides the alignment, keys and weights
+
+    Returns
+    -------
+    count matrix
+    """
+    cache = get_profile_cache(cache)
+    if cache is None or not isinstance(logo.encoded_alignment, EncodedAlignment):
+        logo.weights = get_weights(logo.encoded_alignment, weights, logo.keys, logo.rows, logo.n_jobs)
+        return logo.get_counts()
+    key = get_cache_key(logo.encoded_alignment, keys=None if logo.rows is None else logo.keys, weights=weights,
+                        **parameters)
+    cached = cache.load(key)
+    if cached is not None:
+        count("profile_cache.hits")
+        logo.weights = cached.get("weights")
+        return cached["counts"]
+    count("profile_cache.misses")
+    logo.weights = get_weights(logo.encoded_alignment, weights, logo.keys, logo.rows, logo.n_jobs)
+    counts = logo.get_counts()
+    arrays = dict(counts=counts)
+    if logo.weights is not None:
+        arrays["weights"] = logo.weights
+    cache.save(key, **arrays)
+    return counts
+
+
+def get_color_indices(alphabet, used, color_scheme):
+    """
+    Maps alphabet indices to indices in a list of colors (only for used characters)
+
+    Returns
+    -------
+    array of color indices per alphabet index, list of colors
+    """
+    colors = []
+    color_indices = np.zeros(len(alphabet), dtype=np.intp)
+    for i in np.unique(used).tolist():
+        color = color_scheme[alphabet[i]]
+        if color not in colors:
+            colors.append(color)
+        color_indices[i] = colors.index(color)
+    return color_indices, colors
+
 
 class SequenceLogo:
     """
     class to make sequence logos (displaying percentage of occurrence of amino acids)
     """
 
-    def __init__(self, alignment: dict, positions=None, keys=None, color_scheme: dict = COLOR_SCHEME_AA,
-                 gap_character='X', space_between_glyphs=1, glyph_width=1):
+    def __init__(self, alignment, positions=None, keys=None, color_scheme: dict = COLOR_SCHEME_AA,
+                 gap_character='X', space_between_glyphs=1, glyph_width=1, weights=None, n_jobs=1,
+                 height='frequency', background: dict = None, pseudocount=0., cache=None):
         """
         Parameters
         ----------
         alignment
-            dict of keys to aligned sequences
+            dict of keys to aligned sequences, EncodedAlignment or AlignmentProfile
         positions
             give a list to restrict positions (None => all positions)
         keys
@@ -30,31 +117,239 @@ class SequenceLogo:
             dict of amino acid one letter code to color ('-' colors gaps)
         gap_character
             character to represent gaps
+            (ignored if alignment is already encoded, which has its own)
         space_between_glyphs
         glyph_width
+        weights
+            sequence weights: None (all 1), "henikoff", "identity" (1 / number of 80% identity neighbours),
+            dict of key to weight, or list / array in the order of keys
+            (not supported for an AlignmentProfile, e.g. from from_file, which keeps no sequences)
+        n_jobs
+            number of processes to count with, and threads to compute identity weights with
+            (None or -1 => all CPUs)
+        height
+            frequency (default): stacked frequencies of all characters (gaps included)
+            information: information content in bits
+            relative_entropy: relative entropy in bits against background
+        background
+            dict of character to background probability, used for pseudocounts and relative_entropy
+            (None => uniform over the 20 amino acids)
+        pseudocount
+            total pseudocount weight added to each position, distributed according to background
+        cache
+            ProfileCache or cache directory to load / store counts and weights in,
+            keyed by the alignment content, keys, positions and weights (None => no caching)
         """
         self.alignment = alignment
+        if isinstance(alignment, dict):
+            self.encoded_alignment = EncodedAlignment.from_dict(alignment, gap_character=gap_character)
+        else:
+            self.encoded_alignment = alignment
         if keys is None:
-            self.keys = list(alignment.keys())
+            self.keys = list(self.encoded_alignment.keys)
         else:
             self.keys = keys
-        self.alignment_length = len(self.alignment[self.keys[0]])
+        self.alignment_length = self.encoded_alignment.alignment_length
         self.num_keys = len(self.keys)
         if positions is None:
             self.positions = list(range(self.alignment_length))
         else:
             self.positions = list(positions)
         self.color_scheme = color_scheme
-        self.gap_character = gap_character
+        self.gap_character = self.encoded_alignment.gap_character
+        self.alphabet = self.encoded_alignment.alphabet
         self.space_between_glyphs = space_between_glyphs
         self.glyph_width = glyph_width
-        self.counters = self.get_counters()
+        self.n_jobs = n_jobs
+        if self.keys == self.encoded_alignment.keys:
+            self.rows = None
+        else:
+            self.rows = self.encoded_alignment.get_rows(self.keys)
+        self.counts = count_with_cache(self, weights, cache, kind="column_counts",
+                                       positions=self.get_count_columns())
+        self.total_weight = self.num_keys if self.weights is None else self.weights.sum()
+        self.height = height
+        self.background = background
+        self.pseudocount = pseudocount
+        self.heights = self.get_heights()
+        self.changed = np.zeros(len(self.positions), dtype=bool)
+        self.axes_blocks = None
+
+    @classmethod
+    def from_file(cls, filename, file_format="fasta", positions=None, keys=None, gap_character='X',
+                  chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+        """
+        Streams an alignment file into counts, without loading all sequences into memory
+
+        Parameters
+        ----------
+        filename
+            path (may be gzipped) or open text file
+        file_format
+            fasta, a3m or stockholm
+        positions
+            give a list to restrict positions (None => all positions)
+        keys
+            give a list to restrict keys (None => all keys used), applied while reading
+        gap_character
+            character to represent gaps
+        chunk_size
+            number of sequences encoded at a time
+        kwargs
+            passed to SequenceLogo
+
+        Returns
+        -------
+        SequenceLogo
+        """
+        profile = read_alignment_profile(filename, file_format, keys=keys, gap_character=gap_character,
+                                         chunk_size=chunk_size)
+        return cls(profile, positions=positions, **kwargs)
+
+    @timed("logo.count")
+    def get_counts(self) -> np.ndarray:
+        """
+        Counts characters at each position, restricted to self.keys (rows) and self.positions (columns)
+
+        Returns
+        -------
+        (number of positions x alphabet size) count matrix, columns ordered as self.alphabet
+        """
+        columns = self.get_count_columns()
+        if self.n_jobs != 1 and isinstance(self.encoded_alignment, EncodedAlignment):
+            return parallel_counts(self.encoded_alignment, self.rows, columns, weights=self.weights, n_jobs=self.n_jobs)
+        return self.encoded_alignment.column_counts(self.rows, columns, self.weights)
+
+    def get_count_columns(self):
+        """
+        Alignment columns to count (None => all)
+        """
+        if self.positions == list(range(self.alignment_length)):
+            return None
+        return np.asarray(self.positions, dtype=np.intp)
+
+    def add_sequences(self, sequences: dict, weights=None) -> np.ndarray:
+        """
+        Adds sequences to the counts in place, recomputing heights only for positions whose counts changed
+        (the alignment itself is not modified, so get_counts would not include them)
+
+        Parameters
+        ----------
+        sequences
+            dict of keys to aligned sequences, or EncodedAlignment, with the same alignment length and alphabet
+        weights
+            one weight per sequence (None => all 1)
+
+        Returns
+        -------
+        indices of the changed positions (in self.positions)
+        """
+        return self.update_counts(sequences, weights, 1)
+
+    def remove_sequences(self, sequences: dict, weights=None) -> np.ndarray:
+        """
+        Removes previously counted sequences from the counts in place,
+        recomputing heights only for positions whose counts changed
+
+        Parameters
+        ----------
+        sequences
+            dict of keys to aligned sequences, or EncodedAlignment, with the same alignment length and alphabet
+        weights
+            one weight per sequence, as they were counted with (None => all 1)
+
+        Returns
+        -------
+        indices of the changed positions (in self.positions)
+        """
+        return self.update_counts(sequences, weights, -1)
+
+    @timed("logo.count")
+    def update_counts(self, sequences, weights, sign) -> np.ndarray:
+        if isinstance(sequences, dict):
+            sequences = EncodedAlignment.from_dict(sequences, gap_character=self.gap_character, alphabet=self.alphabet)
+        elif sequences.alphabet != self.alphabet:
+            raise ValueError("Sequences must be encoded with the same alphabet as the logo")
+        if sequences.num_sequences and sequences.alignment_length != self.alignment_length:
+            raise ValueError(f"Sequences must have the alignment length ({sequences.alignment_length} != "
+                             f"{self.alignment_length})")
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+        counts = sequences.column_counts(columns=self.get_count_columns(), weights=weights)
+        changed = np.flatnonzero(counts.any(axis=1))
+        if sign < 0 and np.any(self.counts[changed] - counts[changed] < -1e-9):
+            raise ValueError("Can't remove sequences that were not counted")
+        if weights is not None and self.counts.dtype.kind != 'f':
+            self.counts = self.counts.astype(np.float64)
+        self.counts[changed] += sign * counts[changed].astype(self.counts.dtype)
+        self.heights[changed] = get_heights(self.counts[changed], self.alphabet, self.height, self.background,
+                                            self.pseudocount)
+        added_weight = sequences.num_sequences if weights is None else weights.sum()
+        self.total_weight += sign * added_weight
+        keys = list(sequences.keys)
+        if sign > 0:
+            self.keys = self.keys + keys
+        else:
+            removed = set(keys)
+            self.keys = [key for key in self.keys if key not in removed]
+        self.num_keys = len(self.keys)
+        self.changed[changed] = True
+        return changed
+
+    def update_axes(self, ax, block_size=COLUMN_BLOCK_SIZE) -> list:
+        """
+        Adds the logo to ax as one GlyphCollection per block of positions.
+        If it was already added to ax, only replaces the blocks with positions changed
+        by add_sequences / remove_sequences since the last call
+
+        Parameters
+        ----------
+        ax
+            matplotlib Axes
+        block_size
+            number of positions per collection
+
+        Returns
+        -------
+        list of the collections added
+        """
+        if self.axes_blocks is None or self.axes_blocks[0] is not ax or self.axes_blocks[1] != block_size:
+            blocks = range((len(self.positions) + block_size - 1) // block_size)
+            self.axes_blocks = (ax, block_size, {})
+        else:
+            blocks = np.unique(np.flatnonzero(self.changed) // block_size).tolist()
+        collections = self.axes_blocks[2]
+        added = []
+        for block in blocks:
+            if block in collections:
+                collections[block].remove()
+            columns = np.arange(block * block_size, min((block + 1) * block_size, len(self.positions)))
+            collections[block] = self.make_glyph_table(columns).make_collection()
+            ax.add_collection(collections[block])
+            added.append(collections[block])
+        self.changed[:] = False
+        return added
+
+    @timed("logo.heights")
+    def get_heights(self) -> np.ndarray:
+        """
+        Glyph heights at each position according to self.height (see information.get_heights)
+
+        Returns
+        -------
+        (number of positions x alphabet size) matrix, columns ordered as self.alphabet
+        """
+        return get_heights(self.counts, self.alphabet, self.height, self.background, self.pseudocount)
+
+    @property
+    def counters(self):
+        return self.get_counters()
 
     def get_counters(self):
-        counters = []
-        for p in self.positions:
-            counters.append(Counter([self.alignment[key][p].upper().replace('-', self.gap_character) for key in self.keys]))
-        return counters
+        """
+        Per-position Counters of characters (derived from self.counts)
+        """
+        return [Counter({self.alphabet[i]: n.item() for i, n in enumerate(counts) if n}) for counts in self.counts]
 
     def make_patches(self) -> list:
         """
@@ -64,15 +359,80 @@ class SequenceLogo:
         -------
         list of patches
         """
-        patches = []
-        for x, counter in enumerate(self.counters):
-            y1 = 1
-            for c, n in counter.most_common():
-                y0 = y1 - n / self.num_keys
-                glyph = Glyph(c, self.space_between_glyphs * x, y0, y1,
-                              width=self.glyph_width, color=self.color_scheme[c])
-                patches.append(glyph.make_patch())
-        return patches
+        return self.make_glyph_table().make_patches()
+
+    def make_collection(self):
+        """
+        get a single collection of all glyphs for matplotlib plotting
+        (much faster to add and draw than make_patches for long logos)
+
+        Returns
+        -------
+        GlyphCollection (add with ax.add_collection)
+        """
+        return self.make_glyph_table().make_collection()
+
+    @timed("logo.glyph_table")
+    def make_glyph_table(self, columns=None) -> GlyphTable:
+        """
+        All glyphs, column by column, stacked with the most common on top
+
+        Parameters
+        ----------
+        columns
+            indices of positions (in self.positions) to make glyphs for (None => all)
+
+        Returns
+        -------
+        GlyphTable
+        """
+        if columns is None:
+            columns, characters, y0, y1 = stack_heights(self.heights)
+        else:
+            columns = np.asarray(columns, dtype=np.intp)
+            rows, characters, y0, y1 = stack_heights(self.heights[columns])
+            columns = columns[rows]
+        color_indices, colors = get_color_indices(self.alphabet, characters, self.color_scheme)
+        return GlyphTable.from_arrays(self.space_between_glyphs * columns, y0, y1,
+                                      characters, color_indices[characters], self.alphabet, colors,
+                                      width=self.glyph_width)
+
+    def iterate_glyphs(self):
+        """
+        Iterates over Glyph objects, column by column, most common on top
+        """
+        return self.make_glyph_table().iterate_glyphs()
+
+    def get_xlim(self):
+        """
+        (min, max) x extent of all positions, whether or not they have glyphs
+        """
+        return -self.glyph_width / 2, self.space_between_glyphs * max(0, len(self.positions) - 1) + self.glyph_width / 2
+
+    @timed("logo.write_svg")
+    def write_svg(self, file, column_width=SVG_COLUMN_WIDTH, height=SVG_HEIGHT, block_size=COLUMN_BLOCK_SIZE):
+        """
+        Writes the logo as SVG, block of positions by block of positions,
+        with each character outline defined once and glyphs as transformed references to it
+
+        Parameters
+        ----------
+        file
+            path or open text file
+        column_width
+            width of a position in points
+        height
+            height of the logo in points
+        block_size
+            number of positions whose glyphs are computed at a time
+        """
+        num_columns = len(self.positions)
+        xlim = self.get_xlim()
+        ylim = (0., max(self.heights.sum(axis=1).max(initial=0.), 1e-6))
+        points_per_unit = (column_width / self.space_between_glyphs, height / ylim[1])
+        with open_svg_file(file) as f, SVGWriter(f, xlim, ylim, points_per_unit) as writer:
+            for start in range(0, num_columns, block_size):
+                writer.write_glyphs(self.make_glyph_table(np.arange(start, min(start + block_size, num_columns))))
 
     def get_xticks_labels(self):
         """
@@ -95,14 +455,15 @@ class CoevolutionLogo:
     class to make co-evolution logos (displaying percentage of occurrence of pairs of amino acids)
     """
 
-    def __init__(self, alignment: dict, coevolving_positions: list, keys=None,
+    def __init__(self, alignment, coevolving_positions: list, keys=None,
                  color_scheme: dict = COLOR_SCHEME_AA, gap_character='X',
-                 space_between_glyphs=1, glyph_width=1):
+                 space_between_glyphs=1, glyph_width=1, weights=None, n_jobs=1, cache=None):
         """
         Parameters
         ----------
         alignment
-            dict of keys to aligned sequences
+            dict of keys to aligned sequences, EncodedAlignment
+            or AlignmentProfile (read with pairs=coevolving_positions)
         coevolving_positions
             give a list of tuples to restrict positions
         keys
@@ -111,29 +472,105 @@ class CoevolutionLogo:
             dict of amino acid one letter code to color ('-' colors gaps)
         gap_character
             character to represent gaps
+            (ignored if alignment is already encoded, which has its own)
         space_between_glyphs
         glyph_width
+        weights
+            sequence weights: None (all 1), "henikoff", "identity" (1 / number of 80% identity neighbours),
+            dict of key to weight, or list / array in the order of keys
+            (not supported for an AlignmentProfile, e.g. from from_file, which keeps no sequences)
+        n_jobs
+            number of processes to count with, and threads to compute identity weights with
+            (None or -1 => all CPUs)
+        cache
+            ProfileCache or cache directory to load / store counts and weights in,
+            keyed by the alignment content, keys, coevolving positions and weights (None => no caching)
         """
         self.alignment = alignment
+        if isinstance(alignment, dict):
+            self.encoded_alignment = EncodedAlignment.from_dict(alignment, gap_character=gap_character)
+        else:
+            self.encoded_alignment = alignment
         if keys is None:
-            self.keys = list(alignment.keys())
+            self.keys = list(self.encoded_alignment.keys)
         else:
-            self.keys = [k for k in keys if k in alignment]
-        self.alignment_length = len(self.alignment[self.keys[0]])
+            key_index = self.encoded_alignment.key_index
+            self.keys = [k for k in keys if k in key_index]
+        self.alignment_length = self.encoded_alignment.alignment_length
         self.num_keys = len(self.keys)
         self.coevolving_positions = coevolving_positions
         self.color_scheme = color_scheme
-        self.gap_character = gap_character
+        self.gap_character = self.encoded_alignment.gap_character
+        self.alphabet = self.encoded_alignment.alphabet
         self.space_between_glyphs = space_between_glyphs
         self.glyph_width = glyph_width
-        self.counters = self.get_counters()
+        self.n_jobs = n_jobs
+        if self.keys == self.encoded_alignment.keys:
+            self.rows = None
+        else:
+            self.rows = self.encoded_alignment.get_rows(self.keys)
+        self.counts = count_with_cache(self, weights, cache, kind="pair_counts",
+                                       pairs=[list(pair) for pair in self.coevolving_positions])
+        self.total_weight = self.num_keys if self.weights is None else self.weights.sum()
+
+    @classmethod
+    def from_file(cls, filename, coevolving_positions: list, file_format="fasta", keys=None, gap_character='X',
+                  chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+        """
+        Streams an alignment file into pair counts, without loading all sequences into memory
+
+        Parameters
+        ----------
+        filename
+            path (may be gzipped) or open text file
+        coevolving_positions
+            give a list of tuples to restrict positions
+        file_format
+            fasta, a3m or stockholm
+        keys
+            give a list to restrict keys (None => all keys used), applied while reading
+        gap_character
+            character to represent gaps
+        chunk_size
+            number of sequences encoded at a time
+        kwargs
+            passed to CoevolutionLogo
+
+        Returns
+        -------
+        CoevolutionLogo
+        """
+        profile = read_alignment_profile(filename, file_format, keys=keys, pairs=coevolving_positions,
+                                         gap_character=gap_character, chunk_size=chunk_size)
+        return cls(profile, coevolving_positions, **kwargs)
+
+    @timed("logo.count")
+    def get_counts(self) -> np.ndarray:
+        """
+        Counts character pairs at each pair of coevolving positions, restricted to self.keys
+
+        Returns
+        -------
+        (number of pairs x alphabet size ** 2) count matrix,
+        column a * alphabet size + b counts the pair (self.alphabet[a], self.alphabet[b])
+        """
+        if self.n_jobs != 1 and isinstance(self.encoded_alignment, EncodedAlignment):
+            return parallel_counts(self.encoded_alignment, self.rows, pairs=self.coevolving_positions,
+                                   weights=self.weights, n_jobs=self.n_jobs)
+        return self.encoded_alignment.pair_counts(self.coevolving_positions, self.rows, self.weights)
+
+    @property
+    def counters(self):
+        return self.get_counters()
 
     def get_counters(self):
-        counters = []
-        for p1, p2 in self.coevolving_positions:
-            counters.append(
-                Counter([f"{self.alignment[key][p1]}{self.alignment[key][p2]}".upper().replace('-', self.gap_character) for key in self.keys]))
-        return counters
+        """
+        Per-pair Counters of two-character strings (derived from self.counts)
+        """
+        alphabet_size = len(self.alphabet)
+        return [Counter({f"{self.alphabet[i // alphabet_size]}{self.alphabet[i % alphabet_size]}": n.item()
+                         for i in np.flatnonzero(counts) for n in [counts[i]]})
+                for counts in self.counts]
 
     def make_patches(self):
         """
@@ -143,18 +580,83 @@ class CoevolutionLogo:
         -------
         list of patches
         """
-        patches = []
-        for x, counter in enumerate(self.counters):
-            y1 = 1
-            for c, n in counter.most_common():
-                y0 = y1 - n / self.num_keys
-                glyph_1 = Glyph(c[0], 2 * self.space_between_glyphs * x, y0, y1,
-                                width=self.glyph_width, color=self.color_scheme[c[0]])
-                glyph_2 = Glyph(c[1], 2 * self.space_between_glyphs * x + 1, y0, y1,
-                                width=self.glyph_width, color=self.color_scheme[c[1]])
-                patches.append(glyph_1.make_patch())
-                patches.append(glyph_2.make_patch())
-        return patches
+        return self.make_glyph_table().make_patches()
+
+    def make_collection(self):
+        """
+        get a single collection of all glyphs for matplotlib plotting
+        (much faster to add and draw than make_patches for many pairs)
+
+        Returns
+        -------
+        GlyphCollection (add with ax.add_collection)
+        """
+        return self.make_glyph_table().make_collection()
+
+    @timed("logo.glyph_table")
+    def make_glyph_table(self, pairs=None) -> GlyphTable:
+        """
+        All glyphs, pair by pair, stacked with the most common on top (two consecutive glyphs per character pair)
+
+        Parameters
+        ----------
+        pairs
+            indices of pairs (in self.coevolving_positions) to make glyphs for (None => all)
+
+        Returns
+        -------
+        GlyphTable
+        """
+        alphabet_size = len(self.alphabet)
+        if pairs is None:
+            pairs, codes, y0, y1 = stack_heights(self.counts / self.total_weight)
+        else:
+            pairs = np.asarray(pairs, dtype=np.intp)
+            rows, codes, y0, y1 = stack_heights(self.counts[pairs] / self.total_weight)
+            pairs = pairs[rows]
+        characters = np.stack([codes // alphabet_size, codes % alphabet_size], axis=1).ravel()
+        x = (2 * self.space_between_glyphs * pairs[:, None] + np.arange(2)).ravel()
+        color_indices, colors = get_color_indices(self.alphabet, characters, self.color_scheme)
+        return GlyphTable.from_arrays(x, np.repeat(y0, 2), np.repeat(y1, 2),
+                                      characters, color_indices[characters], self.alphabet, colors,
+                                      width=self.glyph_width)
+
+    def iterate_glyphs(self):
+        """
+        Iterates over Glyph objects, pair by pair, most common on top (two glyphs per character pair)
+        """
+        return self.make_glyph_table().iterate_glyphs()
+
+    def get_xlim(self):
+        """
+        (min, max) x extent of all pairs of positions, whether or not they have glyphs
+        """
+        return (-self.glyph_width / 2,
+                2 * self.space_between_glyphs * max(0, len(self.coevolving_positions) - 1) + 1 + self.glyph_width / 2)
+
+    @timed("logo.write_svg")
+    def write_svg(self, file, column_width=SVG_COLUMN_WIDTH, height=SVG_HEIGHT, block_size=COLUMN_BLOCK_SIZE):
+        """
+        Writes the logo as SVG, block of pairs by block of pairs,
+        with each character outline defined once and glyphs as transformed references to it
+
+        Parameters
+        ----------
+        file
+            path or open text file
+        column_width
+            width of a position in points
+        height
+            height of the logo in points
+        block_size
+            number of pairs whose glyphs are computed at a time
+        """
+        num_pairs = len(self.coevolving_positions)
+        xlim = self.get_xlim()
+        ylim = (0., max(self.counts.sum(axis=1).max(initial=0.) / self.total_weight, 1e-6))
+        with open_svg_file(file) as f, SVGWriter(f, xlim, ylim, (column_width, height / ylim[1])) as writer:
+            for start in range(0, num_pairs, block_size):
+                writer.write_glyphs(self.make_glyph_table(np.arange(start, min(start + block_size, num_pairs))))
 
     def get_xticks_labels(self):
         """
@@ -0,0 +1,141 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from clemmys.alignment import EncodedAlignment
+
+BLOCKS_PER_JOB = 4
+
+
+def get_n_jobs(n_jobs):
+    """
+    Number of processes to use (None or -1 => all CPUs)
+    """
+    if n_jobs is None or n_jobs < 0:
+        return os.cpu_count() or 1
+    return max(1, n_jobs)
+
+
+@contextmanager
+def share_alignment(alignment: EncodedAlignment):
+    """
+    Makes the alignment matrix available to worker processes without pickling it:
+    memory-mapped alignments are re-opened from their file, others are copied once into shared memory
+
+    Returns
+    -------
+    picklable description of the matrix, for attach_matrix
+    """
+    matrix = alignment.matrix
+    if isinstance(matrix, np.memmap) and alignment.filename is not None and matrix.flags.c_contiguous:
+        yield ("memmap", str(matrix.filename), matrix.offset, matrix.shape)
+        return
+    shared = shared_memory.SharedMemory(create=True, size=max(1, matrix.nbytes))
+    try:
+        np.ndarray(matrix.shape, dtype=np.uint8, buffer=shared.buf)[:] = matrix
+        yield ("shared_memory", shared.name, 0, matrix.shape)
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+@contextmanager
+def attach_matrix(description):
+    """
+    Opens a matrix shared with share_alignment (in a worker process)
+    """
+    kind, name, offset, shape = description
+    if kind == "memmap":
+        yield np.memmap(name, dtype=np.uint8, mode="r", offset=offset, shape=shape)
+        return
+    shared = shared_memory.SharedMemory(name=name)
+    try:
+        matrix = np.ndarray(shape, dtype=np.uint8, buffer=shared.buf)
+        yield matrix
+        del matrix
+    finally:
+        shared.close()
+
+
+def _count_block(description, alphabet, gap_character, rows, columns, pairs, weights):
+    with attach_matrix(description) as matrix:
+        if isinstance(rows, tuple):
+            block = EncodedAlignment(matrix[rows[0]: rows[1]], [], alphabet, gap_character)
+            rows = None
+        else:
+            block = EncodedAlignment(matrix, [], alphabet, gap_character)
+        if pairs is not None:
+            counts = block.pair_counts(pairs, rows, weights)
+        else:
+            counts = block.column_counts(rows, columns, weights)
+        # views into shared memory must be released before it is closed
+        del block, matrix
+    return counts
+
+
+def get_row_blocks(num_rows, rows, n_jobs):
+    """
+    Splits rows (or all num_rows rows if rows is None) into contiguous blocks, in order
+
+    Returns
+    -------
+    list of (rows, (start, stop)), rows is (start, stop) itself if rows is None
+    """
+    num_blocks = min(max(1, num_rows), n_jobs * BLOCKS_PER_JOB)
+    bounds = np.linspace(0, num_rows, num_blocks + 1).astype(int)
+    bounds = [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+    if rows is None:
+        return [(bound, bound) for bound in bounds]
+    return [(rows[start: stop], (start, stop)) for start, stop in bounds]
+
+
+def parallel_counts(alignment: EncodedAlignment, rows=None, columns=None, pairs=None, weights=None, n_jobs=None):
+    """
+    Splits the alignment into row blocks, counts each in a process pool and sums the partial counts.
+    The result is identical to EncodedAlignment.column_counts / pair_counts
+    (weighted counts can differ by floating point rounding, as partial sums are added in a different order)
+
+    Parameters
+    ----------
+    alignment
+        EncodedAlignment (memory-mapped alignments are shared through their file)
+    rows
+        row indices to count (None => all rows)
+    columns
+        column indices to count (None => all columns), ignored if pairs is given
+    pairs
+        list of (column 1, column 2) tuples to count character pairs for
+    weights
+        one weight per counted row (None => unweighted)
+    n_jobs
+        number of processes (None or -1 => all CPUs)
+
+    Returns
+    -------
+    (number of columns x alphabet size) or (number of pairs x alphabet size ** 2) count matrix
+    """
+    n_jobs = get_n_jobs(n_jobs)
+    if pairs is not None:
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+    if rows is not None:
+        rows = np.asarray(rows, dtype=np.intp)
+    num_rows = alignment.num_sequences if rows is None else len(rows)
+    if n_jobs == 1:
+        if pairs is not None:
+            return alignment.pair_counts(pairs, rows, weights)
+        return alignment.column_counts(rows, columns, weights)
+    counts = None
+    with share_alignment(alignment) as description:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(_count_block, description, alignment.alphabet, alignment.gap_character,
+                                       block, columns, pairs, None if weights is None else weights[start: stop])
+                       for block, (start, stop) in get_row_blocks(num_rows, rows, n_jobs)]
+            for future in futures:
+                if counts is None:
+                    counts = future.result()
+                else:
+                    counts += future.result()
+    return counts
@@ -0,0 +1,207 @@
+import threading
+
+import numpy as np
+from matplotlib import image as m_image
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.transforms import Affine2D
+
+from clemmys.glyph import GlyphTable, get_glyph_outline
+
+ATLAS_RESOLUTION = 256
+MAX_RESAMPLED_TILES = 4096
+PIXELS_PER_COLUMN = 8
+IMAGE_HEIGHT = 64
+
+
+class GlyphAtlas:
+    """
+    Coverage masks of glyph outlines (the extents of each outline stretched to a square tile),
+    rasterized once with Agg and stored as summed-area tables, so they can be resampled to any box size
+    by averaging, with cost independent of the outline's complexity
+    """
+
+    def __init__(self, font_name='sans', font_weight='normal', dont_stretch_more_than='E',
+                 resolution=ATLAS_RESOLUTION):
+        """
+        Parameters
+        ----------
+        font_name, font_weight, dont_stretch_more_than
+            as in Glyph
+        resolution
+            width and height of each tile in pixels
+        """
+        self.font_name = font_name
+        self.font_weight = font_weight
+        self.dont_stretch_more_than = dont_stretch_more_than
+        self.resolution = resolution
+        self._tables = {}
+        self._tiles = {}
+        self._lock = threading.Lock()
+
+    def rasterize(self, character) -> np.ndarray:
+        """
+        (resolution x resolution) coverage of a character's outline, top row first
+        """
+        outline = get_glyph_outline(character, self.font_name, self.font_weight, self.dont_stretch_more_than)
+        xmin, ymin, width, height = outline.extents.bounds
+        renderer = RendererAgg(self.resolution, self.resolution, 72)
+        gc = renderer.new_gc()
+        gc.set_linewidth(0)
+        gc.set_antialiased(True)
+        transform = Affine2D().translate(-xmin, -ymin).scale(self.resolution / max(width, 1e-12),
+                                                              self.resolution / max(height, 1e-12))
+        renderer.draw_path(gc, outline.path, transform, (0., 0., 0., 1.))
+        gc.restore()
+        return np.asarray(renderer.buffer_rgba())[:, :, 3] / 255.
+
+    def get_table(self, character) -> np.ndarray:
+        """
+        ((resolution + 1) x (resolution + 1)) summed-area table of a character's coverage
+        """
+        with self._lock:
+            if character in self._tables:
+                return self._tables[character]
+        table = np.zeros((self.resolution + 1, self.resolution + 1))
+        table[1:, 1:] = self.rasterize(character).cumsum(axis=0).cumsum(axis=1)
+        with self._lock:
+            self._tables[character] = table
+        return table
+
+    def resample(self, character, height: int, width: int) -> np.ndarray:
+        """
+        (height x width) coverage of a character, each pixel averaging the tile area it covers
+        (the most recent MAX_RESAMPLED_TILES sizes are kept, as glyph boxes of a logo often share sizes)
+        """
+        key = (character, height, width)
+        with self._lock:
+            if key in self._tiles:
+                return self._tiles[key]
+        tile = self.make_tile(character, height, width)
+        with self._lock:
+            if len(self._tiles) >= MAX_RESAMPLED_TILES:
+                self._tiles.pop(next(iter(self._tiles)))
+            self._tiles[key] = tile
+        return tile
+
+    def make_tile(self, character, height: int, width: int) -> np.ndarray:
+        table = self.get_table(character)
+        rows = np.round(np.linspace(0, self.resolution, height + 1)).astype(np.intp)
+        columns = np.round(np.linspace(0, self.resolution, width + 1)).astype(np.intp)
+        rows[1:] = np.maximum(rows[1:], rows[:-1] + 1)
+        columns[1:] = np.maximum(columns[1:], columns[:-1] + 1)
+        rows, columns = np.minimum(rows, self.resolution), np.minimum(columns, self.resolution)
+        sums = (table[rows[1:, None], columns[None, 1:]] - table[rows[:-1, None], columns[None, 1:]]
+                - table[rows[1:, None], columns[None, :-1]] + table[rows[:-1, None], columns[None, :-1]])
+        areas = np.maximum((rows[1:] - rows[:-1])[:, None] * (columns[1:] - columns[:-1])[None, :], 1)
+        return sums / areas
+
+
+_ATLASES = {}
+_ATLASES_LOCK = threading.Lock()
+
+
+def get_glyph_atlas(font_name='sans', font_weight='normal', dont_stretch_more_than='E',
+                    resolution=ATLAS_RESOLUTION) -> GlyphAtlas:
+    """
+    Process-wide GlyphAtlas for a font
+    """
+    key = (font_name, font_weight, dont_stretch_more_than, resolution)
+    with _ATLASES_LOCK:
+        if key not in _ATLASES:
+            _ATLASES[key] = GlyphAtlas(*key)
+        return _ATLASES[key]
+
+
+def render_glyph_table(table: GlyphTable, xlim, ylim, width: int, height: int, background=(1., 1., 1., 1.),
+                       atlas: GlyphAtlas = None) -> np.ndarray:
+    """
+    Composes the glyphs of a GlyphTable into an image by resampling atlas tiles into their boxes
+    (boxes are snapped to whole pixels)
+
+    Parameters
+    ----------
+    table
+        GlyphTable
+    xlim, ylim
+        (min, max) data limits of the image
+    width, height
+        image size in pixels
+    background
+        RGBA background color
+    atlas
+        GlyphAtlas (None => the process-wide atlas for the table's font)
+
+    Returns
+    -------
+    (height x width x 4) float RGBA image, top row first
+    """
+    if atlas is None:
+        atlas = get_glyph_atlas(table.font_name, table.font_weight, table.dont_stretch_more_than)
+    image = np.empty((height, width, 4))
+    image[:] = background
+    visible = table.get_visible()
+    outlines = table.get_outlines()
+    affines = table.get_affines(outlines)[visible]
+    extents = {i: outline.extents.bounds for i, outline in outlines.items()}
+    characters = table.character[visible].tolist()
+    facecolors = table.get_facecolors()[visible]
+    x_scale = width / (xlim[1] - xlim[0])
+    y_scale = height / (ylim[1] - ylim[0])
+    for character, affine, color in zip(characters, affines, facecolors):
+        xmin, ymin, extent_width, extent_height = extents[character]
+        left = (affine[0, 0] * xmin + affine[0, 2] - xlim[0]) * x_scale
+        right = left + affine[0, 0] * extent_width * x_scale
+        top = (ylim[1] - (affine[1, 1] * (ymin + extent_height) + affine[1, 2])) * y_scale
+        bottom = top + affine[1, 1] * extent_height * y_scale
+        column_0, column_1 = int(round(left)), int(round(right))
+        row_0, row_1 = int(round(top)), int(round(bottom))
+        if column_1 <= column_0 or row_1 <= row_0:
+            continue
+        coverage = atlas.resample(table.characters[character], row_1 - row_0, column_1 - column_0)
+        # clip to the image
+        rows = slice(max(row_0, 0), min(row_1, height))
+        columns = slice(max(column_0, 0), min(column_1, width))
+        if rows.stop <= rows.start or columns.stop <= columns.start:
+            continue
+        alpha = coverage[rows.start - row_0: rows.stop - row_0, columns.start - column_0: columns.stop - column_0,
+                         None] * color[3]
+        region = image[rows, columns]
+        region[:, :, :3] = region[:, :, :3] * (1 - alpha) + color[:3] * alpha
+        region[:, :, 3:] = region[:, :, 3:] * (1 - alpha) + alpha
+    return image
+
+
+def render_logo_image(logo, pixels_per_column=PIXELS_PER_COLUMN, height=IMAGE_HEIGHT,
+                      background=(1., 1., 1., 1.)) -> np.ndarray:
+    """
+    Raster image of a SequenceLogo or CoevolutionLogo (anything with make_glyph_table and get_xlim),
+    spanning all positions of the logo, including leading and trailing ones without glyphs
+
+    Parameters
+    ----------
+    logo
+    pixels_per_column
+        width of each glyph column in pixels
+    height
+        image height in pixels
+    background
+        RGBA background color
+
+    Returns
+    -------
+    (height x width x 4) float RGBA image
+    """
+    table = logo.make_glyph_table()
+    xlim = logo.get_xlim()
+    ylim = (0., max(float(table.y1.max(initial=0.)), 1e-6))
+    num_columns = int(round((xlim[1] - xlim[0]) / logo.glyph_width))
+    return render_glyph_table(table, xlim, ylim, max(1, num_columns * pixels_per_column), height, background)
+
+
+def save_logo_png(logo, filename, pixels_per_column=PIXELS_PER_COLUMN, height=IMAGE_HEIGHT,
+                  background=(1., 1., 1., 1.)):
+    """
+    Writes a raster image of a logo (see render_logo_image) with imsave
+    """
+    image = render_logo_image(logo, pixels_per_column, height, background)
+    m_image.imsave(filename, np.clip(image, 0., 1.))
@@ -0,0 +1,359 @@
+import gzip
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from clemmys.alignment import ALPHABET, BINARY_HEADER_SIZE, EncodedAlignment, encode_sequences, make_alphabet, \
+    make_lookup_table, write_binary_header, write_binary_keys
+
+DEFAULT_CHUNK_SIZE = 10000
+FILE_FORMATS = ("fasta", "a3m", "stockholm")
+A3M_INSERTS = re.compile(r"[a-z.]")
+
+
+@contextmanager
+def open_alignment_file(filename):
+    """
+    Opens a path (gzipped if it ends with .gz) for reading text, or passes through an open file object
+    """
+    if hasattr(filename, "read"):
+        yield filename
+        return
+    filename = Path(filename)
+    if filename.suffix == ".gz":
+        with gzip.open(filename, "rt") as f:
+            yield f
+    else:
+        with open(filename) as f:
+            yield f
+
+
+def read_fasta(file, a3m=False):
+    """
+    Iterates over records of a FASTA / A3M file
+
+    Parameters
+    ----------
+    file
+        open text file
+    a3m
+        if True, removes insert states (lower-case letters and '.')
+
+    Returns
+    -------
+    iterator of (key, sequence), key is the first word of the header line
+    """
+    key, parts = None, []
+    for line in file:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(">"):
+            if key is not None:
+                yield key, "".join(parts)
+            key, parts = line[1:].split(maxsplit=1)[0] if len(line) > 1 else "", []
+        elif key is not None:
+            parts.append(A3M_INSERTS.sub("", line) if a3m else line)
+    if key is not None:
+        yield key, "".join(parts)
+
+
+def read_stockholm(file):
+    """
+    Iterates over sequence segments of a (possibly interleaved) Stockholm file
+
+    Parameters
+    ----------
+    file
+        open text file
+
+    Returns
+    -------
+    iterator of (column offset, key, segment), every segment of one block shares the same column offset
+    """
+    offset, width = 0, None
+    block_keys = set()
+    for line in file:
+        line = line.strip()
+        if not line or line.startswith("#") or line == "//":
+            if not line and width is not None:
+                offset += width
+                width = None
+                block_keys = set()
+            continue
+        key, segment = line.split(maxsplit=1)
+        segment = segment.replace(" ", "")
+        if key in block_keys:
+            # block without a separating blank line
+            offset += width
+            width = None
+            block_keys = set()
+        block_keys.add(key)
+        if width is None:
+            width = len(segment)
+        yield offset, key, segment
+
+
+def iterate_chunks(filename, file_format="fasta", keys=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams an alignment file in chunks of sequences (or, for interleaved Stockholm, of sequence segments)
+
+    Parameters
+    ----------
+    filename
+        path or open text file
+    file_format
+        fasta, a3m or stockholm
+    keys
+        give a list to restrict keys (None => all keys used)
+    chunk_size
+        maximum number of sequences per chunk
+
+    Returns
+    -------
+    iterator of (column offset, list of keys, list of sequences)
+    """
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"file_format must be one of {FILE_FORMATS}")
+    if keys is not None:
+        keys = set(keys)
+    with open_alignment_file(filename) as file:
+        if file_format == "stockholm":
+            records = read_stockholm(file)
+        else:
+            records = ((0, key, sequence) for key, sequence in read_fasta(file, a3m=file_format == "a3m"))
+        chunk_offset, chunk_keys, chunk_sequences = 0, [], []
+        for offset, key, sequence in records:
+            if keys is not None and key not in keys:
+                continue
+            if chunk_keys and (offset != chunk_offset or len(chunk_keys) == chunk_size):
+                yield chunk_offset, chunk_keys, chunk_sequences
+                chunk_keys, chunk_sequences = [], []
+            chunk_offset = offset
+            chunk_keys.append(key)
+            chunk_sequences.append(sequence)
+        if chunk_keys:
+            yield chunk_offset, chunk_keys, chunk_sequences
+
+
+class AlignmentProfile:
+    """
+    Column (and optionally column pair) counts accumulated chunk by chunk,
+    without keeping the sequences themselves.
+    Can be used in place of an EncodedAlignment in SequenceLogo and CoevolutionLogo
+    """
+
+    def __init__(self, pairs=None, gap_character='X', alphabet=ALPHABET):
+        """
+        Parameters
+        ----------
+        pairs
+            list of (column 1, column 2) tuples to count character pairs for (None => no pairs)
+        gap_character
+            character to represent gaps ('-' and '.' are mapped to this)
+        alphabet
+            characters to encode (gap_character is added if missing)
+        """
+        self.alphabet = make_alphabet(gap_character, alphabet)
+        self.gap_character = gap_character.upper()
+        self.lookup_table = make_lookup_table(self.alphabet, gap_character)
+        self.keys = []
+        self._key_index = None
+        self.counts = np.zeros((0, len(self.alphabet)), dtype=np.int64)
+        self.pairs = [] if pairs is None else [tuple(pair) for pair in pairs]
+        self.pair_table = np.zeros((len(self.pairs), len(self.alphabet) ** 2), dtype=np.int64)
+        self._pair_index = {pair: i for i, pair in enumerate(self.pairs)}
+        # columns of pairs spanning two Stockholm blocks, kept until finalize
+        self._split_pairs = []
+        self._split_columns = {}
+        self._row = 0
+        self._block_offset = 0
+
+    @property
+    def alignment_length(self):
+        return self.counts.shape[0]
+
+    @property
+    def key_index(self):
+        if self._key_index is None:
+            self._key_index = {key: i for i, key in enumerate(self.keys)}
+        return self._key_index
+
+    def add(self, keys, sequences, offset=0):
+        """
+        Adds the counts of a chunk of aligned sequences (or sequence segments starting at column offset)
+        """
+        if not keys:
+            return
+        chunk = EncodedAlignment(encode_sequences(sequences, self.lookup_table), keys,
+                                 self.alphabet, self.gap_character)
+        width = chunk.alignment_length
+        # only Stockholm continuation blocks (offset > 0) extend the alignment
+        if offset == 0 and self.keys and width != self.alignment_length:
+            raise ValueError(f"Aligned sequences must have the same length ({width} != {self.alignment_length})")
+        if offset != self._block_offset:
+            self._block_offset, self._row = offset, 0
+        if offset == 0:
+            self.keys += keys
+            self._key_index = None
+        if offset + width > self.alignment_length:
+            self.counts = np.vstack([self.counts,
+                                     np.zeros((offset + width - self.alignment_length, len(self.alphabet)),
+                                              dtype=np.int64)])
+        self.counts[offset: offset + width] += chunk.column_counts()
+        if self.pairs:
+            self.add_pairs(chunk, offset)
+        self._row += len(keys)
+
+    def add_pairs(self, chunk, offset):
+        width = chunk.alignment_length
+        inside = [(offset <= p1 < offset + width, offset <= p2 < offset + width) for p1, p2 in self.pairs]
+        local_pairs = [i for i, (in_1, in_2) in enumerate(inside) if in_1 and in_2]
+        if local_pairs:
+            self.pair_table[local_pairs] += chunk.pair_counts(np.array([self.pairs[i] for i in local_pairs]) - offset)
+        for i, (in_1, in_2) in enumerate(inside):
+            if in_1 != in_2:
+                column = self.pairs[i][0] if in_1 else self.pairs[i][1]
+                if i not in self._split_pairs:
+                    self._split_pairs.append(i)
+                stored = self._split_columns.setdefault(column, [])
+                if sum(len(part) for part in stored) == self._row:
+                    stored.append(chunk.matrix[:, column - offset].copy())
+
+    def finalize(self):
+        """
+        Counts pairs whose columns were in different Stockholm blocks, call after the last chunk
+        """
+        alphabet_size = len(self.alphabet)
+        for i in self._split_pairs:
+            p1, p2 = self.pairs[i]
+            codes = np.concatenate(self._split_columns[p1]).astype(np.intp) * alphabet_size
+            codes += np.concatenate(self._split_columns[p2])
+            self.pair_table[i] = np.bincount(codes, minlength=alphabet_size ** 2)
+        self._split_pairs, self._split_columns = [], {}
+        return self
+
+    def get_rows(self, keys=None):
+        if keys is None or list(keys) == self.keys:
+            return None
+        raise ValueError("AlignmentProfile counts can't be restricted to other keys, pass keys when reading instead")
+
+    def column_counts(self, rows=None, columns=None, weights=None) -> np.ndarray:
+        """
+        Same as EncodedAlignment.column_counts, rows and weights must be None (keys are restricted while reading)
+        """
+        if rows is not None or weights is not None:
+            raise ValueError("AlignmentProfile counts can't be restricted to rows or weighted")
+        if columns is None:
+            return self.counts.copy()
+        return self.counts[columns]
+
+    def pair_counts(self, pairs, rows=None, weights=None) -> np.ndarray:
+        """
+        Same as EncodedAlignment.pair_counts, pairs must have been given when reading
+        """
+        if rows is not None or weights is not None:
+            raise ValueError("AlignmentProfile counts can't be restricted to rows or weighted")
+        try:
+            indices = [self._pair_index[tuple(pair)] for pair in pairs]
+        except KeyError as e:
+            raise ValueError(f"Pair {e.args[0]} was not counted, pass it in pairs when reading") from e
+        return self.pair_table[indices]
+
+
+def read_alignment_profile(filename, file_format="fasta", keys=None, pairs=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                           gap_character='X', alphabet=ALPHABET) -> AlignmentProfile:
+    """
+    Streams an alignment file into column (and pair) counts,
+    with memory bounded by chunk_size x alignment length
+
+    Parameters
+    ----------
+    filename
+        path (may be gzipped) or open text file
+    file_format
+        fasta, a3m (insert states are removed) or stockholm
+    keys
+        give a list to restrict keys (None => all keys used)
+    pairs
+        list of (column 1, column 2) tuples to count character pairs for (e.g. coevolving_positions)
+    chunk_size
+        number of sequences encoded at a time
+    gap_character
+        character to represent gaps
+    alphabet
+        characters to encode (gap_character is added if missing)
+
+    Returns
+    -------
+    AlignmentProfile
+    """
+    profile = AlignmentProfile(pairs, gap_character, alphabet)
+    for offset, chunk_keys, chunk_sequences in iterate_chunks(filename, file_format, keys, chunk_size):
+        profile.add(chunk_keys, chunk_sequences, offset)
+    return profile.finalize()
+
+
+def convert_to_binary(filename, output, file_format="fasta", keys=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                      gap_character='X', alphabet=ALPHABET):
+    """
+    Streams an alignment file into the clemmys binary format (open it with EncodedAlignment.load)
+
+    Parameters
+    ----------
+    filename
+        path (may be gzipped) or open text file
+    output
+        path of the binary file to write
+    file_format
+        fasta, a3m or stockholm (Stockholm files are read twice, file objects must be seekable)
+    keys
+        give a list to restrict keys (None => all keys used)
+    chunk_size
+        number of sequences encoded at a time
+    gap_character
+        character to represent gaps
+    alphabet
+        characters to encode (gap_character is added if missing)
+    """
+    alphabet = make_alphabet(gap_character, alphabet)
+    lookup_table = make_lookup_table(alphabet, gap_character)
+    if file_format == "stockholm":
+        # sequences are split over blocks, so find the matrix shape first and fill it block by block
+        all_keys, length = [], 0
+        for offset, chunk_keys, chunk_sequences in iterate_chunks(filename, file_format, keys, chunk_size):
+            if offset == 0:
+                all_keys += chunk_keys
+            length = max(length, offset + len(chunk_sequences[0]))
+        shape = (len(all_keys), length)
+        with open(output, "wb") as f:
+            write_binary_header(f, shape, alphabet, gap_character)
+        matrix = np.memmap(output, dtype=np.uint8, mode="r+", offset=BINARY_HEADER_SIZE, shape=shape)
+        if hasattr(filename, "seek"):
+            filename.seek(0)
+        row, block_offset = 0, 0
+        for offset, chunk_keys, chunk_sequences in iterate_chunks(filename, file_format, keys, chunk_size):
+            if offset != block_offset:
+                row, block_offset = 0, offset
+            chunk = encode_sequences(chunk_sequences, lookup_table)
+            matrix[row: row + len(chunk_keys), offset: offset + chunk.shape[1]] = chunk
+            row += len(chunk_keys)
+        matrix.flush()
+        del matrix
+        with open(output, "r+b") as f:
+            write_binary_keys(f, all_keys, shape, alphabet, gap_character)
+        return
+    all_keys, length = [], None
+    with open(output, "wb") as f:
+        write_binary_header(f, (0, 0), alphabet, gap_character)
+        for _, chunk_keys, chunk_sequences in iterate_chunks(filename, file_format, keys, chunk_size):
+            chunk = encode_sequences(chunk_sequences, lookup_table)
+            if length is None:
+                length = chunk.shape[1]
+            elif chunk.shape[1] != length:
+                raise ValueError(f"Aligned sequences must have the same length ({chunk.shape[1]} != {length})")
+            f.write(chunk.tobytes())
+            all_keys += chunk_keys
+        write_binary_keys(f, all_keys, (len(all_keys), length or 0), alphabet, gap_character)
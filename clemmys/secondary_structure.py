@@ -1,12 +1,229 @@
 import numpy as np
+from matplotlib import collections as m_collections
 from matplotlib import patches as m_patches
+from matplotlib.path import Path as m_Path
 
 from clemmys.colors import COLOR_SCHEME_SS
+from clemmys.instrumentation import count, timed
+from clemmys.svg import SVGWriter, open_svg_file
 
 """
 Code adapted from https://gist.github.com/JoaoRodrigues/f9906b343d3acb38e39f2b982b02ecb0"
 """
 
+SS_DICT = {'H': 'H', 'G': 'H', 'I': 'H',
+           'B': 'E', 'E': 'E',
+           'T': 'T', 'S': 'T',
+           'C': 'C'}
+SS_TYPES = "HETC"
+WAVE_RESOLUTION = 16
+SVG_COLUMN_WIDTH = 12.
+ARC_RESOLUTION = 32
+COIL_ZORDER = 1.
+ELEMENT_ZORDER = 1.1
+
+
+def make_compound_path(vertices, closed=False) -> m_Path:
+    """
+    One path made of many polylines (or closed polygons)
+
+    Parameters
+    ----------
+    vertices
+        (number of pieces x number of vertices x 2) array, or list of (number of vertices x 2) arrays
+    closed
+        if True, the last vertex of each piece closes it
+    """
+    lengths = np.array([len(piece) for piece in vertices], dtype=np.intp)
+    codes = np.full(lengths.sum(), m_Path.LINETO, dtype=m_Path.code_type)
+    piece_starts = np.cumsum(lengths) - lengths
+    codes[piece_starts] = m_Path.MOVETO
+    if closed:
+        codes[piece_starts + lengths - 1] = m_Path.CLOSEPOLY
+    return m_Path(np.concatenate(vertices).reshape(-1, 2), codes)
+
+
+def make_ss_lookup(ss_dict=None, default='C') -> np.ndarray:
+    """
+    256-entry table mapping label bytes to simplified ss labels (as bytes)
+
+    Parameters
+    ----------
+    ss_dict
+        dict of label to H, E, T or C (None => SS_DICT)
+    default
+        simplified label of labels not in ss_dict
+    """
+    if ss_dict is None:
+        ss_dict = SS_DICT
+    lookup = np.full(256, ord(default), dtype=np.uint8)
+    for label, ss in ss_dict.items():
+        lookup[ord(label)] = ord(ss)
+    return lookup
+
+
+def encode_ss_labels(ss_labels) -> np.ndarray:
+    """
+    Label bytes of a string, list of single character labels or uint8 array
+    """
+    if isinstance(ss_labels, np.ndarray) and ss_labels.dtype == np.uint8:
+        return ss_labels
+    if isinstance(ss_labels, str):
+        return np.frombuffer(ss_labels.encode("ascii"), dtype=np.uint8)
+    return np.asarray(list(ss_labels), dtype="S1").view(np.uint8)
+
+
+@timed("ss.blocks")
+def get_ss_blocks(ss_labels, ss_dict=None):
+    """
+    Run-length encodes simplified ss labels
+
+    Parameters
+    ----------
+    ss_labels
+        string, list of single character labels or uint8 array of label bytes
+    ss_dict
+        dict of label to H, E, T or C (None => SS_DICT), other labels are C
+
+    Returns
+    -------
+    simplified label bytes, start indices, end indices (inclusive) of each block
+    """
+    codes = make_ss_lookup(ss_dict)[encode_ss_labels(ss_labels)]
+    if not len(codes):
+        return codes, np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    starts = np.concatenate([[0], np.flatnonzero(codes[1:] != codes[:-1]) + 1])
+    ends = np.concatenate([starts[1:] - 1, [len(codes) - 1]])
+    return codes[starts], starts, ends
+
+
+def get_neighbour_types(types: np.ndarray, row_starts=None):
+    """
+    Types of the previous and next blocks (0 where there is none)
+
+    Parameters
+    ----------
+    types
+        block types from get_ss_blocks
+    row_starts
+        boolean array, True for blocks starting a new track (None => a single track)
+    """
+    previous = np.concatenate([[0], types[:-1]]).astype(np.uint8)
+    following = np.concatenate([types[1:], [0]]).astype(np.uint8)
+    if row_starts is not None:
+        previous[row_starts] = 0
+        following[np.concatenate([row_starts[1:], [False]])] = 0
+    return previous, following
+
+
+def make_wave_vertices(starts, ends, x, y, height, resolution=WAVE_RESOLUTION) -> list:
+    """
+    Helix waves as polylines: alternating upper and lower half-ellipses, two per residue
+
+    Parameters
+    ----------
+    starts
+        array of helix starts
+    ends
+        array of helix ends (inclusive)
+    x
+        x offset
+    y
+        single value or array of bases (the wave spans y to y + height)
+    height
+        height of the wave
+    resolution
+        vertices per half-ellipse
+
+    Returns
+    -------
+    list of (number of vertices x 2) arrays, one per helix
+    """
+    starts, ends = np.asarray(starts), np.asarray(ends)
+    y = np.broadcast_to(np.asarray(y, dtype=float), starts.shape)
+    num_arcs = 2 * (ends - starts + 1)
+    helix_indices = np.repeat(np.arange(len(starts)), num_arcs)
+    arc_indices = np.arange(num_arcs.sum()) - np.repeat(np.cumsum(num_arcs) - num_arcs, num_arcs)
+    centers = starts[helix_indices] + arc_indices * 0.5 + 0.25 + x
+    signs = np.where(arc_indices % 2 == 0, 1., -1.)
+    angles = np.linspace(np.pi, 0, resolution)
+    vertices = np.empty((len(centers), resolution, 2))
+    vertices[:, :, 0] = centers[:, None] + 0.25 * np.cos(angles)
+    vertices[:, :, 1] = (y[helix_indices] + height / 2)[:, None] + signs[:, None] * height / 2 * np.sin(angles)
+    return np.split(vertices.reshape(-1, 2), np.cumsum(num_arcs * resolution)[:-1])
+
+
+def make_turn_vertices(starts, ends, x, y, height, resolution=ARC_RESOLUTION) -> np.ndarray:
+    """
+    Turns as upper half-ellipses spanning each block
+
+    Returns
+    -------
+    (number of turns x resolution x 2) array
+    """
+    starts, ends = np.asarray(starts), np.asarray(ends)
+    y = np.broadcast_to(np.asarray(y, dtype=float), starts.shape)
+    lengths = ends - starts + 1
+    angles = np.linspace(np.pi, 0, resolution)
+    vertices = np.empty((len(starts), resolution, 2))
+    vertices[:, :, 0] = (starts + lengths / 2 + x)[:, None] + (lengths / 2)[:, None] * np.cos(angles)
+    vertices[:, :, 1] = (y + height / 2)[:, None] + height / 2 * np.sin(angles)
+    return vertices
+
+
+def make_sheet_vertices(starts, ends, x, y, width, tail_height, head_height) -> np.ndarray:
+    """
+    Sheets as flat arrows with a head a quarter of their length, as drawn by m_patches.FancyArrow
+
+    Returns
+    -------
+    (number of sheets x 8 x 2) array of closed polygons
+    """
+    starts, ends = np.asarray(starts), np.asarray(ends)
+    y = np.broadcast_to(np.asarray(y, dtype=float), starts.shape)
+    lengths = ends - starts + 1
+    tail, tip = starts + x, starts + lengths + x
+    neck = tip - lengths / 4
+    middle = y + width / 2
+    vertices = np.empty((len(starts), 8, 2))
+    vertices[:, :, 0] = np.stack([tip, neck, neck, tail, tail, neck, neck, tip], axis=1)
+    vertices[:, :, 1] = np.stack([middle, middle - head_height / 2, middle - tail_height / 2, middle - tail_height / 2,
+                                  middle + tail_height / 2, middle + tail_height / 2, middle + head_height / 2,
+                                  middle], axis=1)
+    return vertices
+
+
+def make_coil_vertices(starts, ends, previous, following, x, y, width) -> np.ndarray:
+    """
+    Coils as straight lines, extended into neighbouring helices, turns (by 4 points) and sheets (by half a residue)
+
+    Parameters
+    ----------
+    starts
+        array of coil starts
+    ends
+        array of coil ends (inclusive)
+    previous
+        array of previous block types (from get_neighbour_types)
+    following
+        array of next block types (from get_neighbour_types)
+
+    Returns
+    -------
+    (number of coils x 2 x 2) array
+    """
+    starts, ends = np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
+    y = np.broadcast_to(np.asarray(y, dtype=float), starts.shape)
+    curved = np.isin(previous, [ord('H'), ord('T')])
+    sheet = previous == ord('E')
+    starts = starts - np.where(curved, 4 / 72, np.where(sheet, 0.5, 0.))
+    ends = ends + 1 + np.where(np.isin(following, [ord('H'), ord('T')]), 4 / 72,
+                               np.where(following == ord('E'), 0.5, 0.))
+    vertices = np.empty((len(starts), 2, 2))
+    vertices[:, 0, 0], vertices[:, 1, 0] = starts + x, ends + x
+    vertices[:, :, 1] = (y + width / 2)[:, None]
+    return vertices
+
 
 class SecondaryStructure:
     def __init__(self, ss_labels: list, x=0, y=0, helix_as_wave=True, width=2.,
@@ -35,10 +252,7 @@ class SecondaryStructure:
         """
         self.ss_labels = ss_labels
         self.helix_as_wave = helix_as_wave
-        self.ss_dict = {'H': 'H', 'G': 'H', 'I': 'H',
-                        'B': 'E', 'E': 'E',
-                        'T': 'T', 'S': 'T',
-                        'C': 'C'}
+        self.ss_dict = dict(SS_DICT)
         self.ss_blocks = self.get_continuous_ss_blocks()
         self.x = x
         self.y = y
@@ -62,6 +276,7 @@ class SecondaryStructure:
         self.helix_arc_width = 2.0
         self.helix_arc_height = self.width
         self.helix_arc_length = 0.5
+        self.helix_wave_resolution = WAVE_RESOLUTION  # vertices per half-ellipse
 
         # SHEET
         self.fc_sheet = color_scheme["fc_sheet"]
@@ -85,22 +300,12 @@ class SecondaryStructure:
 
         Returns
         -------
-        list of tuples [(ss_label, start, length)]
-        """
-        ss_blocks = []
-        prev_ss = None
-        prev_i = 0
-        for i, ss in enumerate(self.ss_labels):
-            ss = self.ss_dict.get(ss, 'C')
-            if prev_ss is None:
-                prev_ss = ss
-            if ss != prev_ss:
-                ss_blocks.append((prev_ss, prev_i, i - 1))
-                prev_ss = ss
-                prev_i = i
-        ss_blocks.append((self.ss_labels[-1], prev_i, len(self.ss_labels) - 1))
-        return ss_blocks
+        list of tuples [(ss_label, start, end)], end inclusive
+        """
+        types, starts, ends = get_ss_blocks(self.ss_labels, self.ss_dict)
+        return list(zip(types.tobytes().decode("ascii"), starts.tolist(), ends.tolist()))
 
+    @timed("ss.patches")
     def make_patches(self):
         """
         Makes matplotlib patches for each ss stretch, with x starting at self.x and y at self.y
@@ -125,8 +330,99 @@ class SecondaryStructure:
                 if i + 1 < len(self.ss_blocks):
                     next_ss = self.ss_blocks[i + 1][0]
                 patches.append(self.make_coil(start, end, prev_ss, next_ss))
+        count("artists.patches", len(patches))
         return patches
 
+    @timed("ss.collections")
+    def make_collections(self):
+        """
+        Makes one matplotlib collection per element type, with x starting at self.x and y at self.y
+
+        Returns
+        -------
+        list of matplotlib collections (coils first, so they are drawn below the other elements)
+        """
+        types, starts, ends = get_ss_blocks(self.ss_labels, self.ss_dict)
+        previous, following = get_neighbour_types(types)
+        return self.make_block_collections(types, starts, ends, previous, following, self.y)
+
+    @timed("ss.write_svg")
+    def write_svg(self, file, column_width=SVG_COLUMN_WIDTH):
+        """
+        Writes the secondary structure as SVG, one path per element type
+
+        Parameters
+        ----------
+        file
+            path or open text file
+        column_width
+            width of a residue in points (the same scale is used for y)
+        """
+        xlim = (self.x - 0.5, self.x + len(self.ss_labels) + 0.5)
+        ylim = (self.y - 0.5, self.y + self.width + 0.5)
+        with open_svg_file(file) as f, SVGWriter(f, xlim, ylim, (column_width, column_width)) as writer:
+            for collection in self.make_collections():
+                writer.write_collection(collection)
+
+    def make_block_collections(self, types, starts, ends, previous, following, y):
+        """
+        Makes one matplotlib collection (holding a single compound path) per element type
+        for blocks from get_ss_blocks
+
+        Parameters
+        ----------
+        types, starts, ends
+            from get_ss_blocks
+        previous, following
+            from get_neighbour_types
+        y
+            single value or one base per block
+
+        Returns
+        -------
+        list of matplotlib collections (coils first, with COIL_ZORDER below the ELEMENT_ZORDER of the others)
+        """
+        y = np.broadcast_to(np.asarray(y, dtype=float), starts.shape)
+
+        def make_lines(vertices, color, linewidth, zorder=ELEMENT_ZORDER):
+            return m_collections.PathCollection([make_compound_path(vertices)], facecolors="none",
+                                                edgecolors=color, linewidths=linewidth, capstyle="butt",
+                                                zorder=zorder)
+
+        collections = []
+        coils = types == ord('C')
+        if coils.any():
+            vertices = make_coil_vertices(starts[coils], ends[coils], previous[coils], following[coils],
+                                          self.x, y[coils], self.width)
+            collections.append(make_lines(vertices, self.fc_coil, self.coil_height, COIL_ZORDER))
+        turns = types == ord('T')
+        if turns.any():
+            vertices = make_turn_vertices(starts[turns], ends[turns], self.x, y[turns], self.turn_height)
+            collections.append(make_lines(vertices, self.fc_turn, self.helix_arc_width))
+        sheets = types == ord('E')
+        if sheets.any():
+            vertices = make_sheet_vertices(starts[sheets], ends[sheets], self.x, y[sheets], self.width,
+                                           self.sheet_tail_height, self.sheet_head_height - 0.001)
+            collections.append(m_collections.PathCollection([make_compound_path(vertices, closed=True)],
+                                                            facecolors=self.fc_sheet, edgecolors=self.edgecolor,
+                                                            linewidths=self.edge_thickness,
+                                                            zorder=ELEMENT_ZORDER))
+        helices = types == ord('H')
+        if helices.any():
+            if self.helix_as_wave:
+                vertices = make_wave_vertices(starts[helices], ends[helices], self.x, y[helices],
+                                              self.helix_arc_height, self.helix_wave_resolution)
+                collections.append(make_lines(vertices, self.fc_helix, self.helix_arc_width))
+            else:
+                patches = []
+                for start, end, block_y in zip(starts[helices].tolist(), ends[helices].tolist(),
+                                               y[helices].tolist()):
+                    patches += self.make_helix_cylinder(start, end, block_y)
+                collections.append(m_collections.PatchCollection(patches, match_original=True,
+                                                                 zorder=ELEMENT_ZORDER))
+        count("artists.collections", len(collections))
+        return collections
+
     def make_helix_ellipse(self, origin):
         return m_patches.Ellipse(origin,
                                  self.helix_ellipse_length,
@@ -150,30 +446,29 @@ class SecondaryStructure:
                              edgecolor=self.fc_helix)
 
     def make_helix_wave(self, start, end):
-        patches = []
-        start_theta, end_theta = self.start_theta, self.end_theta
-        for arc_start in np.arange(start, end + 1, self.helix_arc_length):
-            origin = (arc_start + 0.25 + self.x, self.helix_arc_height / 2 + self.y)
-            patches.append(self.make_helix_arc(origin, start_theta, end_theta))
-            start_theta += 180
-            end_theta += 180
-        return patches
+        vertices = make_wave_vertices([start], [end], self.x, self.y, self.helix_arc_height,
+                                      self.helix_wave_resolution)[0]
+        return [m_patches.PathPatch(m_Path(vertices), fill=False,
+                                    linewidth=self.helix_arc_width,
+                                    edgecolor=self.fc_helix)]
 
-    def make_helix_cylinder(self, start, end):
+    def make_helix_cylinder(self, start, end, y=None):
+        if y is None:
+            y = self.y
         patches = []
         # Origin is *center* of ellipse
         origin = (start + self.helix_ellipse_length / 2 + self.x,
-                  self.helix_ellipse_height / 2 + self.y)
+                  self.helix_ellipse_height / 2 + y)
         # First ellipse
         patches.append(self.make_helix_ellipse(origin))
 
         # Rectangle(s)
         length = end - start + 1 - self.helix_ellipse_length  # deduct l of the ellipses
-        origin = (start + self.helix_ellipse_length / 2 + self.x, self.y)  # origin is lower left: make it v-cntr
+        origin = (start + self.helix_ellipse_length / 2 + self.x, y)  # origin is lower left: make it v-cntr
         patches.append(self.make_helix_rectangle(length, origin))
 
         # Second ellipse
-        origin = (end + 1 - self.helix_ellipse_length / 2 + self.x, self.helix_ellipse_height / 2 + self.y)
+        origin = (end + 1 - self.helix_ellipse_length / 2 + self.x, self.helix_ellipse_height / 2 + y)
         patches.append(self.make_helix_ellipse(origin))
         return patches
 
@@ -234,3 +529,110 @@ class SecondaryStructure:
             length += 0.5
         origin = (start + self.x, self.width / 2 + self.y)
         return self.make_coil_connection(origin, length)
+
+
+GAP_CHARACTERS = "-."
+PANEL_WAVE_RESOLUTION = 6
+
+
+@timed("ss.blocks")
+def get_ss_block_matrix(ss_labels, ss_dict=None, gap_characters=GAP_CHARACTERS):
+    """
+    Run-length encodes simplified ss labels of many aligned tracks in one pass, blocks never span tracks
+
+    Parameters
+    ----------
+    ss_labels
+        list of equal length label strings, or (number of tracks x number of columns) array of labels / label bytes
+    ss_dict
+        dict of label to H, E, T or C (None => SS_DICT), other labels are C
+    gap_characters
+        labels of alignment gaps, no element is drawn there
+
+    Returns
+    -------
+    simplified label bytes ('-' for gaps), track indices, start columns, end columns (inclusive) of each block
+    """
+    if isinstance(ss_labels, np.ndarray) and ss_labels.ndim == 2:
+        labels = ss_labels.astype("S1").view(np.uint8) if ss_labels.dtype != np.uint8 else ss_labels
+    else:
+        labels = np.stack([encode_ss_labels(track) for track in ss_labels]) if len(ss_labels) else \
+            np.zeros((0, 0), dtype=np.uint8)
+    lookup = make_ss_lookup(ss_dict)
+    lookup[[ord(c) for c in gap_characters]] = ord('-')
+    codes = lookup[labels]
+    num_columns = codes.shape[1]
+    block_starts = np.ones(codes.shape, dtype=bool)
+    block_starts[:, 1:] = codes[:, 1:] != codes[:, :-1]
+    flat_starts = np.flatnonzero(block_starts)
+    flat_ends = np.concatenate([flat_starts[1:] - 1, [codes.size - 1]]) if len(flat_starts) else flat_starts
+    return (codes.ravel()[flat_starts], flat_starts // max(1, num_columns),
+            flat_starts % max(1, num_columns), flat_ends % max(1, num_columns))
+
+
+class SecondaryStructurePanel:
+    def __init__(self, ss_labels, x=0, y=0, track_spacing=None, helix_as_wave=True, width=2.,
+                 color_scheme=COLOR_SCHEME_SS, gap_characters=GAP_CHARACTERS,
+                 wave_resolution=PANEL_WAVE_RESOLUTION):
+        """
+        Plot secondary structure of many aligned proteins, one track per protein
+
+        Parameters
+        ----------
+        ss_labels
+            list of equal length label strings aligned to alignment columns,
+            or (number of proteins x number of columns) array of labels / label bytes
+            H: helix, E: sheet, T: turn, C: coil, gap_characters: gap
+        x
+            start position on x-axis (default 0)
+        y
+            height on y-axis of the first track (default 0)
+        track_spacing
+            track i is drawn at y + i * track_spacing,
+            use a negative value to draw the first track on top (default 1.5 * width)
+        helix_as_wave
+            helix can be drawn as a wave (True) or as a rectangle (False)
+            (default True)
+        width
+            width controller for all the elements (default 2)
+        color_scheme
+            specifies colors for each element
+            must have keys: fc_helix, fc_sheet, fc_coil, fc_turn
+            (default: see colors.py COLOR_SCHEME_SS)
+        gap_characters
+            labels of alignment gaps (default - and .)
+        wave_resolution
+            vertices per half-ellipse of helix waves
+            (default 6, lower than for a single track as panels usually span many columns)
+        """
+        self.ss_labels = ss_labels
+        self.y = y
+        self.track_spacing = 1.5 * width if track_spacing is None else track_spacing
+        # element sizes and colors are shared with SecondaryStructure
+        self.style = SecondaryStructure([], x=x, y=y, helix_as_wave=helix_as_wave, width=width,
+                                        color_scheme=color_scheme)
+        self.style.helix_wave_resolution = wave_resolution
+        self.types, self.tracks, self.starts, self.ends = get_ss_block_matrix(ss_labels, self.style.ss_dict,
+                                                                              gap_characters)
+
+    @property
+    def num_tracks(self):
+        return len(self.ss_labels)
+
+    def get_track_y(self, tracks):
+        return self.y + np.asarray(tracks) * self.track_spacing
+
+    @timed("ss.collections")
+    def make_collections(self):
+        """
+        Makes one matplotlib collection per element type for all tracks
+
+        Returns
+        -------
+        list of matplotlib collections (coils first, so they are drawn below the other elements)
+        """
+        previous, following = get_neighbour_types(self.types, self.starts == 0)
+        drawn = self.types != ord('-')
+        return self.style.make_block_collections(self.types[drawn], self.starts[drawn], self.ends[drawn],
+                                                 previous[drawn], following[drawn],
+                                                 self.get_track_y(self.tracks[drawn]))
@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+
+from matplotlib import colors as m_colors
+from matplotlib.path import Path as m_Path
+
+from clemmys.glyph import GlyphTable
+
+SVG_HEADER = ('<?xml version="1.0" encoding="utf-8"?>\n'
+              '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+              'width="{width:.7g}pt" height="{height:.7g}pt" viewBox="0 0 {width:.7g} {height:.7g}">\n')
+PATH_COMMANDS = {m_Path.MOVETO: "M", m_Path.LINETO: "L", m_Path.CURVE3: "Q", m_Path.CURVE4: "C"}
+POINTS_PER_DATA_UNIT = 12.
+
+
+def format_path(path: m_Path, precision=5) -> str:
+    """
+    SVG path data of a matplotlib path, with coordinates rounded to precision significant digits
+    """
+    commands = []
+    for vertices, code in path.iter_segments(simplify=False, curves=True):
+        if code == m_Path.CLOSEPOLY:
+            commands.append("Z")
+        elif code != m_Path.STOP:
+            commands.append(PATH_COMMANDS[code] + " ".join(f"{v:.{precision}g}" for v in vertices))
+    return "".join(commands)
+
+
+def format_color(color, name="fill") -> str:
+    """
+    SVG color (and opacity, if not opaque) attributes of a matplotlib color
+    """
+    if isinstance(color, str) and color == "none":
+        return f'{name}="none"'
+    rgba = m_colors.to_rgba(color)
+    attributes = f'{name}="{m_colors.to_hex(rgba)}"'
+    if rgba[3] < 1:
+        attributes += f' {name}-opacity="{rgba[3]:.3g}"'
+    return attributes
+
+
+@contextmanager
+def open_svg_file(file):
+    """
+    Opens a path for writing text, or passes through an open file object
+    """
+    if hasattr(file, "write"):
+        yield file
+        return
+    with open(file, "w") as f:
+        yield f
+
+
+class SVGWriter:
+    """
+    Writes SVG directly to a file object: each glyph outline is written once in <defs>
+    (the first time it is used) and every glyph is a <use> of it with its own affine transform,
+    so output size depends on the number of glyphs, not on the complexity of their outlines
+    """
+
+    def __init__(self, file, xlim, ylim, points_per_unit=(POINTS_PER_DATA_UNIT, POINTS_PER_DATA_UNIT)):
+        """
+        Parameters
+        ----------
+        file
+            open text file
+        xlim, ylim
+            (min, max) data limits of the drawing
+        points_per_unit
+            (x, y) size of one data unit in points
+        """
+        self.file = file
+        self.xlim, self.ylim = xlim, ylim
+        self.scale = points_per_unit
+        self.width = (xlim[1] - xlim[0]) * points_per_unit[0]
+        self.height = (ylim[1] - ylim[0]) * points_per_unit[1]
+        self.outline_ids = {}
+
+    def __enter__(self):
+        self.file.write(SVG_HEADER.format(width=self.width, height=self.height))
+        # data coordinates, y up
+        sx, sy = self.scale
+        self.file.write(f'<g transform="matrix({sx:.7g} 0 0 {-sy:.7g} {-self.xlim[0] * sx:.7g} '
+                        f'{self.height + self.ylim[0] * sy:.7g})">\n')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.write("</g>\n</svg>\n")
+
+    def get_outline_id(self, key, outline) -> str:
+        """
+        Id of an outline's definition, writing it the first time it is used
+        """
+        if key not in self.outline_ids:
+            self.outline_ids[key] = f"glyph{len(self.outline_ids)}"
+            self.file.write(f'<defs><path id="{self.outline_ids[key]}" d="{format_path(outline.path)}"/></defs>\n')
+        return self.outline_ids[key]
+
+    def write_glyphs(self, table: GlyphTable):
+        """
+        Writes the visible glyphs of a GlyphTable, in order
+        """
+        visible = table.get_visible()
+        outlines = table.get_outlines()
+        ids = {i: self.get_outline_id((table.characters[i], table.font_name, table.font_weight,
+                                       table.dont_stretch_more_than), outline)
+               for i, outline in outlines.items()}
+        affines = table.get_affines(outlines)[visible]
+        fills = [format_color(color) for color in table.get_facecolors()[visible]]
+        stroke = ""
+        if table.edgewidth > 0:
+            stroke = (f' {format_color(table.edgecolor, "stroke")} stroke-width="{table.edgewidth:.3g}" '
+                      f'vector-effect="non-scaling-stroke"')
+        lines = [f'<use xlink:href="#{ids[character]}" transform="matrix({a[0, 0]:.6g} 0 0 {a[1, 1]:.6g} '
+                 f'{a[0, 2]:.7g} {a[1, 2]:.7g})" {fill}{stroke}/>\n'
+                 for character, a, fill in zip(table.character[visible].tolist(), affines, fills)]
+        self.file.writelines(lines)
+
+    def write_path(self, path: m_Path, facecolor="none", edgecolor="none", linewidth=0., capstyle="butt"):
+        """
+        Writes a path in data coordinates, linewidth in points
+        """
+        attributes = f'{format_color(facecolor)} {format_color(edgecolor, "stroke")}'
+        if linewidth > 0 and not (isinstance(edgecolor, str) and edgecolor == "none"):
+            attributes += (f' stroke-width="{linewidth:.3g}" stroke-linecap="{capstyle}" '
+                           f'vector-effect="non-scaling-stroke"')
+        self.file.write(f'<path d="{format_path(path, precision=7)}" {attributes}/>\n')
+
+    def write_collection(self, collection):
+        """
+        Writes the paths of a matplotlib collection (in data coordinates, without offsets)
+        """
+        paths = collection.get_paths()
+        facecolors = collection.get_facecolor()
+        edgecolors = collection.get_edgecolor()
+        linewidths = collection.get_linewidth()
+        capstyle = collection.get_capstyle() or "butt"
+        for i, path in enumerate(paths):
+            facecolor = facecolors[i % len(facecolors)] if len(facecolors) else "none"
+            edgecolor = edgecolors[i % len(edgecolors)] if len(edgecolors) else "none"
+            self.write_path(path, facecolor, edgecolor, float(linewidths[i % len(linewidths)]),
+                            {"projecting": "square"}.get(capstyle, capstyle))
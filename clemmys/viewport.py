@@ -0,0 +1,124 @@
+import numpy as np
+from matplotlib import artist as m_artist
+from matplotlib import collections as m_collections
+
+from clemmys.instrumentation import count, stage
+from clemmys.logo import SequenceLogo, get_color_indices, stack_heights
+
+MIN_PIXELS_PER_COLUMN = 4.
+
+
+class LogoViewportArtist(m_artist.Artist):
+    """
+    Draws a SequenceLogo with only the positions in the visible x-range of its Axes:
+    glyphs when columns are at least min_pixels_per_column wide on screen,
+    stacked colored bars (averaged over several positions when columns are narrower than a pixel) otherwise.
+    Everything is recomputed at draw time from the current axis limits, so panning and zooming
+    cost is bounded by the number of visible columns (and pixels), not by the alignment length
+    """
+
+    def __init__(self, logo: SequenceLogo, min_pixels_per_column=MIN_PIXELS_PER_COLUMN, zorder=None):
+        """
+        Parameters
+        ----------
+        logo
+            SequenceLogo
+        min_pixels_per_column
+            below this on-screen column width, bars are drawn instead of glyphs
+        zorder
+        """
+        super().__init__()
+        self.logo = logo
+        self.min_pixels_per_column = min_pixels_per_column
+        if zorder is not None:
+            self.set_zorder(zorder)
+        self.glyph_cache = None
+
+    def add_to_axes(self, ax):
+        """
+        Adds the artist to ax and includes the whole logo in its data limits
+        """
+        ax.add_artist(self)
+        num_columns = len(self.logo.positions)
+        space = self.logo.space_between_glyphs
+        ax.update_datalim([(-self.logo.glyph_width / 2, 0),
+                           (space * (num_columns - 1) + self.logo.glyph_width / 2,
+                            self.logo.heights.sum(axis=1).max(initial=0.))])
+        ax.autoscale_view()
+        return self
+
+    def invalidate(self):
+        """
+        Drops cached glyphs, call after changing the logo (e.g. with add_sequences)
+        """
+        self.glyph_cache = None
+        self.stale = True
+
+    def get_column_range(self):
+        """
+        Indices (in logo.positions) of the first and after the last visible column
+        """
+        xmin, xmax = sorted(self.axes.get_xlim())
+        space = self.logo.space_between_glyphs
+        margin = self.logo.glyph_width / 2
+        start = int(np.floor((xmin - margin) / space))
+        stop = int(np.ceil((xmax + margin) / space)) + 1
+        num_columns = len(self.logo.positions)
+        return min(max(0, start), num_columns), min(max(0, stop), num_columns)
+
+    def get_pixels_per_column(self) -> float:
+        xmin, xmax = self.axes.get_xlim()
+        return self.axes.bbox.width / max(abs(xmax - xmin), 1e-12) * self.logo.space_between_glyphs
+
+    def make_glyph_collection(self, start, stop):
+        if self.glyph_cache is None or self.glyph_cache[0] != (start, stop):
+            collection = self.logo.make_glyph_table(np.arange(start, stop)).make_collection()
+            self.glyph_cache = ((start, stop), collection)
+        return self.glyph_cache[1]
+
+    def make_bar_collection(self, start, stop, bin_size=1) -> m_collections.PolyCollection:
+        """
+        Stacked bars (largest on top) for columns start to stop,
+        heights averaged over bins of bin_size consecutive columns
+
+        Returns
+        -------
+        PolyCollection
+        """
+        space = self.logo.space_between_glyphs
+        bin_starts = np.arange(start, stop, bin_size)
+        heights = np.add.reduceat(self.logo.heights[start: stop], bin_starts - start, axis=0)
+        heights /= np.diff(np.append(bin_starts, stop))[:, None]
+        bins, characters, y0, y1 = stack_heights(heights)
+        if bin_size == 1:
+            left = space * bin_starts[bins] - self.logo.glyph_width / 2
+            right = left + self.logo.glyph_width
+        else:
+            left = space * bin_starts[bins] - space / 2
+            right = left + space * bin_size
+        vertices = np.stack([np.stack([left, left, right, right], axis=1),
+                             np.stack([y0, y1, y1, y0], axis=1)], axis=2)
+        color_indices, colors = get_color_indices(self.logo.alphabet, characters, self.logo.color_scheme)
+        count("artists.collections")
+        return m_collections.PolyCollection(vertices, facecolors=[colors[i] for i in color_indices[characters]],
+                                            edgecolors="none", antialiaseds=False)
+
+    def draw(self, renderer):
+        if not self.get_visible() or self.axes is None:
+            return
+        start, stop = self.get_column_range()
+        if stop > start:
+            with stage("viewport.draw"):
+                pixels_per_column = self.get_pixels_per_column()
+                if pixels_per_column >= self.min_pixels_per_column:
+                    collection = self.make_glyph_collection(start, stop)
+                else:
+                    collection = self.make_bar_collection(start, stop, max(1, int(np.ceil(1 / pixels_per_column))))
+                collection.axes = self.axes
+                collection.set_figure(self.figure)
+                collection.set_transform(self.get_transform())
+                collection.set_clip_box(self.get_clip_box())
+                collection.set_clip_path(self.get_clip_path())
+                collection.set_zorder(self.get_zorder())
+                collection.draw(renderer)
+        self.stale = False
@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from clemmys.alignment import EncodedAlignment, get_chunk_size
+from clemmys.coevolution import MAX_BLOCK_BYTES, get_compact_alphabet, one_hot
+from clemmys.instrumentation import timed
+from clemmys.parallel import get_n_jobs
+
+IDENTITY_THRESHOLD = 0.8
+
+
+def henikoff_weights(alignment: EncodedAlignment, rows=None) -> np.ndarray:
+    """
+    Position-based sequence weights (Henikoff & Henikoff 1994):
+    each column gives 1 / (number of distinct characters x count of the sequence's character) to a sequence,
+    averaged over columns
+
+    Parameters
+    ----------
+    alignment
+        EncodedAlignment
+    rows
+        row indices to weight (None => all rows)
+
+    Returns
+    -------
+    weights, one per row (summing to 1)
+    """
+    counts = alignment.column_counts(rows)
+    length, alphabet_size = counts.shape
+    distinct = np.count_nonzero(counts, axis=1)
+    contributions = np.zeros(counts.shape)
+    np.divide(1., distinct[:, None] * counts, out=contributions, where=counts > 0)
+    contributions = contributions.ravel()
+    offsets = np.arange(length, dtype=np.intp) * alphabet_size
+
+    num_rows = alignment.num_sequences if rows is None else len(rows)
+    weights = np.zeros(num_rows)
+    chunk_size = get_chunk_size(length)
+    for start in range(0, num_rows, chunk_size):
+        if rows is None:
+            block = alignment.matrix[start: start + chunk_size]
+        else:
+            block = alignment.matrix[rows[start: start + chunk_size]]
+        weights[start: start + len(block)] = contributions[block + offsets].sum(axis=1)
+    return weights / max(1, length)
+
+
+def identity_weights(alignment: EncodedAlignment, threshold=IDENTITY_THRESHOLD, rows=None,
+                     block_size=None, n_jobs=1) -> np.ndarray:
+    """
+    Sequence weights as 1 / number of sequences (including itself) with at least threshold identity,
+    identity being the fraction of identical columns (gaps included).
+    Identities are computed as one-hot matrix products over blocks of rows, so memory is bounded by the block size
+
+    Parameters
+    ----------
+    alignment
+        EncodedAlignment
+    threshold
+        identity threshold for neighbours (default 0.8)
+    rows
+        row indices to weight (None => all rows)
+    block_size
+        number of rows per block (None => chosen to keep one-hot blocks at about MAX_BLOCK_BYTES)
+    n_jobs
+        number of threads to process blocks with (None or -1 => all CPUs)
+
+    Returns
+    -------
+    weights, one per row
+    """
+    matrix = alignment.matrix if rows is None else alignment.matrix[rows]
+    num_rows, length = matrix.shape
+    compact, alphabet_size = get_compact_alphabet(matrix, len(alignment.alphabet))
+    # matches are exact integers in float32, at least threshold * length of them (with slack for rounding)
+    min_matches = np.ceil(threshold * length - 1e-9)
+    if block_size is None:
+        block_size = max(1, min(MAX_BLOCK_BYTES // (4 * max(1, length) * alphabet_size),
+                                int(np.sqrt(MAX_BLOCK_BYTES / 4))))
+    starts = list(range(0, num_rows, block_size))
+
+    def get_one_hot(start):
+        return one_hot(compact[matrix[start: start + block_size]], alphabet_size)
+
+    def process_block_row(start_1):
+        neighbours = np.zeros(num_rows, dtype=np.int64)
+        one_hot_1 = get_one_hot(start_1)
+        for start_2 in starts:
+            if start_2 < start_1:
+                continue
+            similar = (one_hot_1 @ get_one_hot(start_2).T) >= min_matches
+            neighbours[start_1: start_1 + similar.shape[0]] += similar.sum(axis=1)
+            if start_2 != start_1:
+                neighbours[start_2: start_2 + similar.shape[1]] += similar.sum(axis=0)
+        return neighbours
+
+    if not starts:
+        return np.zeros(0)
+    n_jobs = get_n_jobs(n_jobs)
+    if n_jobs == 1:
+        neighbours = sum(process_block_row(start) for start in starts)
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            neighbours = sum(executor.map(process_block_row, starts))
+    return 1. / neighbours
+
+
+@timed("logo.weights")
+def get_weights(alignment, weights, keys=None, rows=None, n_jobs=1) -> np.ndarray:
+    """
+    Resolves the weights argument of SequenceLogo / CoevolutionLogo to one weight per row
+
+    Parameters
+    ----------
+    alignment
+        EncodedAlignment (an AlignmentProfile only supports weights=None, as it keeps no sequences)
+    weights
+        None (all 1), "henikoff", "identity" (80% identity neighbours),
+        dict of key to weight, or list / array in the order of keys
+    keys
+        keys the weights are for
+    rows
+        row indices of keys (None => all rows)
+    n_jobs
+        number of threads to compute identity weights with (None or -1 => all CPUs)
+
+    Returns
+    -------
+    array of weights or None
+    """
+    if weights is None:
+        return None
+    if not isinstance(alignment, EncodedAlignment):
+        raise ValueError("Sequence weights need per-sequence data, "
+                         "use an EncodedAlignment (or the binary format) instead of an AlignmentProfile")
+    if isinstance(weights, str):
+        if weights == "henikoff":
+            return henikoff_weights(alignment, rows)
+        if weights == "identity":
+            return identity_weights(alignment, rows=rows, n_jobs=n_jobs)
+        raise ValueError(f"Unknown weighting scheme {weights}, use henikoff or identity")
+    if isinstance(weights, dict):
+        return np.array([weights[key] for key in keys], dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if len(weights) != len(keys):
+        raise ValueError(f"Expected {len(keys)} weights, got {len(weights)}")
+    return weights
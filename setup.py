@@ -1,7 +1,8 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup(name='clemmys',
       version='1.0',
       authors=["Janani Durairaj"],
       packages=["clemmys"],
-      install_requires=["numpy", "matplotlib"])
+      install_requires=["numpy", "matplotlib"],
+      entry_points={"console_scripts": ["clemmys = clemmys.cli:main"]})
@@ -0,0 +1,34 @@
+import pytest
+
+from clemmys.cli import get_aligned_sequence
+
+SEQUENCES = {"seq1": "ACDEFGHIKLMNPQR-STVWYACDEFGHIK--LMNPQ",
+             "seq2": "ACDEF-HIKLMNPQRASTVWYACDEFGHIKAALMNPQ"}
+
+
+def write_interleaved_stockholm(filename, sequences, block_width=15):
+    length = len(next(iter(sequences.values())))
+    with open(filename, "w") as f:
+        f.write("# STOCKHOLM 1.0\n\n")
+        for start in range(0, length, block_width):
+            for key, sequence in sequences.items():
+                f.write(f"{key} {sequence[start: start + block_width]}\n")
+            f.write("\n")
+        f.write("//\n")
+
+
+def test_get_aligned_sequence_joins_stockholm_blocks(tmp_path):
+    filename = tmp_path / "interleaved.sto"
+    write_interleaved_stockholm(filename, SEQUENCES)
+    item = {"alignment": str(filename)}
+    for key, sequence in SEQUENCES.items():
+        assert get_aligned_sequence(item, key, alignment_length=37) == sequence
+
+
+def test_get_aligned_sequence_checks_length(tmp_path):
+    filename = tmp_path / "interleaved.sto"
+    write_interleaved_stockholm(filename, SEQUENCES)
+    with pytest.raises(ValueError):
+        get_aligned_sequence({"alignment": str(filename)}, "seq1", alignment_length=40)
+    with pytest.raises(KeyError):
+        get_aligned_sequence({"alignment": str(filename)}, "seq3")